@@ -0,0 +1,48 @@
+import logging
+from collections import namedtuple
+from .models import Achievement
+
+logger = logging.getLogger(__name__)
+
+# ``stats`` lists the profile fields a rule depends on; a rule is only evaluated when one of them changed
+AchievementRule = namedtuple('AchievementRule', ['name', 'description', 'stats', 'condition'])
+
+RULES = []
+
+
+def register(name, description, stats, condition):
+    RULES.append(AchievementRule(name, description, frozenset(stats), condition))
+
+
+register('7-Day Streak Master', 'Maintained a 7-day streak',
+         ['current_streak'], lambda profile: profile.current_streak >= 7)
+register('Task Completion Hero', 'Achieved 80% discipline score',
+         ['discipline_score'], lambda profile: profile.discipline_score >= 80)
+register('Health Guardian', 'Maintained 100% avatar health',
+         ['avatar_health'], lambda profile: profile.avatar_health >= 100)
+
+
+def evaluate_achievements(profile, changed=None):
+    """Unlock any achievements the profile now qualifies for.
+
+    ``changed`` is the set of profile fields that changed; ``None`` evaluates every rule.
+    Already-unlocked names are read from ``profile.unlocked_achievements``, so this costs no
+    queries unless something new is unlocked. Returns the newly created achievements.
+    """
+    unlocked = set(profile.unlocked_achievements)
+    new = [
+        rule for rule in RULES
+        if rule.name not in unlocked
+        and (changed is None or rule.stats & set(changed))
+        and rule.condition(profile)
+    ]
+    logger.debug('achievements evaluated', extra={'profile_id': profile.pk, 'changed': changed, 'unlocked': [r.name for r in new]})
+    if not new:
+        return []
+    created = Achievement.objects.bulk_create(
+        [Achievement(profile=profile, name=rule.name, description=rule.description) for rule in new],
+        ignore_conflicts=True,  # a concurrent request may have unlocked the same one
+    )
+    profile.unlocked_achievements = sorted(unlocked | {rule.name for rule in new})
+    profile.save(update_fields=['unlocked_achievements'])
+    return created
@@ -15,4 +15,12 @@ class TaskAdmin(admin.ModelAdmin):
     # This adds a filter sidebar on the right to sort by completion or user
     list_filter = ('is_completed', 'profile')
     # Adds a search bar for task titles
-    search_fields = ('title',)
\ No newline at end of file
+    search_fields = ('title',)
+
+    # Deleting here leaves tombstones too, so /api/sync/ clients drop the task
+    def delete_model(self, request, obj):
+        obj.soft_delete()
+
+    def delete_queryset(self, request, queryset):
+        for task in queryset:
+            task.soft_delete()
\ No newline at end of file
@@ -0,0 +1,90 @@
+import hashlib
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from .lru import LRUCache
+from .models import DisciplineProfile
+
+# Only what request.user needs; never the password hash, the shared cache may be inspected or dumped
+USER_FIELDS = ['id', 'username', 'email', 'is_active', 'is_staff', 'is_superuser']
+
+local_tokens = LRUCache(
+    getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000),
+    getattr(settings, 'AUTH_TOKEN_LOCAL_TTL', 30),
+)
+
+
+def get_cache():
+    return caches[getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', 'default')]
+
+
+def token_cache_key(key):
+    # Never use the raw token as a cache key, the shared cache may be inspected or dumped
+    return 'authtoken:v2:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_token(key):
+    cache_key = token_cache_key(key)
+    local_tokens.pop(cache_key)
+    get_cache().delete(cache_key)
+
+
+def load_token(key):
+    try:
+        token = Token.objects.select_related('user__disciplineprofile').get(key=key)
+    except Token.DoesNotExist:
+        raise exceptions.AuthenticationFailed(_('Invalid token.'))
+    user = token.user
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+    profile = getattr(user, 'disciplineprofile', None)
+    return [getattr(user, name) for name in USER_FIELDS], profile.pk if profile else None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that resolves a token to (user, profile id) without touching the
+    database in the common case.
+
+    Lookups go through a per-process LRU, then the shared cache, then a single query. Token
+    and user writes invalidate both layers (see core.signals); other processes drop their
+    local copy within AUTH_TOKEN_LOCAL_TTL seconds. Each request gets its own User instance,
+    so nothing a view caches on ``request.user`` leaks into the next request.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        entry = local_tokens.get(cache_key)
+        if entry is None:
+            shared = get_cache()
+            entry = shared.get(cache_key)
+            if entry is None:
+                entry = load_token(key)
+                shared.set(cache_key, entry, getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300))
+            local_tokens.set(cache_key, entry)
+        values, profile_id = entry
+        user = User.from_db('default', USER_FIELDS, values)
+        user.profile_id = profile_id
+        return user, key
+
+
+def profile_id_for(user):
+    """The user's profile id: free after CachedTokenAuthentication, one query otherwise."""
+    profile_id = getattr(user, 'profile_id', None)
+    if profile_id is None:
+        profile_id = DisciplineProfile.objects.filter(user_id=user.pk).values_list('pk', flat=True).first()
+    return profile_id
+
+
+async def aauthenticate(request):
+    """Authenticate a plain Django async view the way the DRF views are; returns the user, or
+    None for a missing or invalid token. Runs in a worker thread since a cache miss queries."""
+    try:
+        result = await sync_to_async(CachedTokenAuthentication().authenticate)(request)
+    except exceptions.AuthenticationFailed:
+        return None
+    return result[0] if result else None
@@ -0,0 +1,70 @@
+import time
+from django.conf import settings
+from . import coachcache, llm
+
+SYSTEM_PROMPT = (
+    "You are an AI coach for a discipline app called SentinL. Help users with motivation, task "
+    "completion, and habit building. Be encouraging and practical."
+)
+TEXT_SYSTEM_PROMPT = SYSTEM_PROMPT + " Keep responses concise and actionable."
+
+
+def chat_messages(message, system_prompt=SYSTEM_PROMPT):
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": message},
+    ]
+
+
+async def transcribe(audio_file):
+    async with llm.session() as client:
+        transcript = await client.audio.transcriptions.create(
+            model=getattr(settings, 'COACH_TRANSCRIPTION_MODEL', 'whisper-1'),
+            file=(audio_file.name or 'audio', audio_file.read()),
+            response_format="text",
+        )
+    return transcript.strip()
+
+
+async def reply(messages, key=None):
+    """Complete ``messages``, as built by ``chat_messages`` or ``memory.build_messages``.
+    With a cache ``key``, only ever given for context-free messages, a reply cached under it
+    is served instead and a new one is stored."""
+    cached = coachcache.get(key) if key else None
+    if cached is not None:
+        return cached
+    started = time.perf_counter()
+    async with llm.session() as client:
+        response = await client.chat.completions.create(
+            model=getattr(settings, 'COACH_MODEL', 'gpt-3.5-turbo'),
+            messages=messages,
+            max_tokens=getattr(settings, 'COACH_MAX_TOKENS', 150),
+        )
+    text = response.choices[0].message.content.strip()
+    if key:
+        coachcache.put(key, text, time.perf_counter() - started)
+    return text
+
+
+async def stream_reply(messages, key=None):
+    """Yield the reply's text deltas as the model generates them; a cached reply arrives as
+    a single delta. Caching works as in ``reply``; only replies streamed to the end are stored."""
+    cached = coachcache.get(key) if key else None
+    if cached is not None:
+        yield cached
+        return
+    started = time.perf_counter()
+    parts = []
+    async with llm.session() as client:
+        stream = await client.chat.completions.create(
+            model=getattr(settings, 'COACH_MODEL', 'gpt-3.5-turbo'),
+            messages=messages,
+            max_tokens=getattr(settings, 'COACH_MAX_TOKENS', 150),
+            stream=True,
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield parts[-1]
+    if key:
+        coachcache.put(key, ''.join(parts).strip(), time.perf_counter() - started)
@@ -0,0 +1,78 @@
+"""Cache for coach replies to common prompts.
+
+Entries live in a per-process LRU with a TTL, keyed on the model, the system prompt's
+version and a similarity key of the user's message. ``COACH_CACHE_KEY_FUNCTION`` names the
+similarity function: ``normalized_key`` (the default) only merges case, punctuation and
+spacing variants, ``token_set_key`` also merges reorderings and filler words.
+
+Cached replies never depend on who asked: only first messages, sent while the user's coach
+memory is still empty, go to the model without the stats and use the cache. Every later
+message carries the user's context and bypasses it (see core.views.coach_context).
+"""
+import hashlib
+import re
+import unicodedata
+from django.conf import settings
+from django.utils.module_loading import import_string
+from . import metrics
+from .lru import LRUCache
+
+lookups = metrics.register(metrics.Counter('sentinl_coach_cache_lookups_total', 'Coach reply cache lookups, by result.'))
+saved_seconds = metrics.register(metrics.Counter('sentinl_coach_cache_saved_seconds_total', 'Upstream latency avoided by coach cache hits.'))
+
+replies = LRUCache(getattr(settings, 'COACH_CACHE_SIZE', 1000), getattr(settings, 'COACH_CACHE_TTL', 3600))
+
+STOPWORDS = frozenset('a an the i im me my to do does how can cant what is it of and or so just really'.split())
+
+
+def normalize(message):
+    text = unicodedata.normalize('NFKC', message).casefold()
+    text = re.sub(r"['’]", '', text)  # "can't" and "cant" are the same prompt
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text).split())
+
+
+def normalized_key(message):
+    return normalize(message)
+
+
+def token_set_key(message):
+    words = {word for word in normalize(message).split() if word not in STOPWORDS}
+    return ' '.join(sorted(words))
+
+
+def prompt_version(system_prompt):
+    return hashlib.sha1(system_prompt.encode()).hexdigest()[:12]
+
+
+def key_for(message, system_prompt):
+    similarity = import_string(getattr(settings, 'COACH_CACHE_KEY_FUNCTION', 'core.coachcache.normalized_key'))
+    model = getattr(settings, 'COACH_MODEL', 'gpt-3.5-turbo')
+    raw = f'{model}:{prompt_version(system_prompt)}:{similarity(message)}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def get(key):
+    entry = replies.get(key)
+    if entry is None:
+        lookups.inc(result='miss')
+        return None
+    text, latency = entry
+    lookups.inc(result='hit')
+    saved_seconds.inc(latency)
+    return text
+
+
+def put(key, text, latency):
+    if text:
+        replies.set(key, (text, latency))
+
+
+def stats():
+    hits, misses = lookups.value(result='hit'), lookups.value(result='miss')
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+        'saved_seconds': round(saved_seconds.value(), 3),
+    }
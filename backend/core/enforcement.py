@@ -0,0 +1,210 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.db import connections, transaction
+from django.db.models import Exists, F, Max, Min, OuterRef, Q, Value
+from django.db.models.functions import Greatest, Mod
+from django.utils import timezone
+from .models import DisciplineProfile, AdaptiveTask, EnforcementRun
+from . import metrics
+from .push import enqueue_pushes
+
+HEALTH_PENALTY = 20
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def unfinished_tasks():
+    # Correlated subquery: any task the profile neither completed nor micro-completed
+    return AdaptiveTask.objects.filter(profile=OuterRef('pk'), is_completed=False, is_micro_completed=False)
+
+
+def enforceable_profiles(shard=0, shard_count=1):
+    queryset = DisciplineProfile.objects.filter(is_in_sickness_mode=False)
+    if shard_count > 1:
+        # Hash partition on the primary key so shards stay balanced as old ids are deleted
+        queryset = queryset.alias(shard=Mod(F('pk'), Value(shard_count))).filter(shard=shard)
+    return queryset
+
+
+def queue_penalty_notifications(notify):
+    enqueue_pushes([
+        {
+            'profile_id': profile_id,
+            'to': token,
+            'title': 'Avatar Damaged!',
+            'body': f'Your avatar health dropped to {health}% due to missed tasks.',
+        }
+        for profile_id, token, health in notify
+    ])
+
+
+def due_on(run_date):
+    # Profiles not yet stamped for this enforcement date
+    return Q(last_enforced_on__isnull=True) | Q(last_enforced_on__lt=run_date)
+
+
+def iter_id_ranges(queryset, chunk_size, after=None):
+    # Walk the primary key space in fixed-width windows so every chunk is an index range scan
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return
+    start = bounds['low']
+    while start <= bounds['high']:
+        yield start, start + chunk_size
+        start += chunk_size
+
+
+def penalize_range(queryset, start, stop, on_chunk=None, mark=None, run=None):
+    """Reset streaks and damage health for every profile in [start, stop) with unfinished tasks.
+
+    ``on_chunk`` receives the penalized profiles that have a push token as
+    (id, push_token, new_health) tuples and runs inside the chunk's transaction.
+    ``mark`` is a dict of field values written to every profile in the range afterwards,
+    and ``run`` is an EnforcementRun whose checkpoint advances past the range, both in the
+    same transaction. Returns (penalized, notified) row counts.
+    """
+    window = queryset.filter(pk__gte=start, pk__lt=stop)
+    chunk = window.filter(Exists(unfinished_tasks()))
+    with transaction.atomic():
+        # UPDATE first so the transaction takes its write lock up front; the Exists filter
+        # still matches the same rows afterwards, now carrying the new health
+        penalized = chunk.update(
+            current_streak=0,
+            avatar_health=Greatest(F('avatar_health') - HEALTH_PENALTY, Value(0)),
+            version=F('version') + 1,
+        )
+        notify = list(
+            chunk.exclude(push_token__isnull=True).exclude(push_token='')
+            .values_list('pk', 'push_token', 'avatar_health')
+        ) if penalized and on_chunk else []
+        if mark:
+            window.update(**mark)
+        if notify:
+            on_chunk(notify)
+        if run is not None:
+            EnforcementRun.objects.filter(pk=run.pk).update(
+                last_profile_id=stop - 1,
+                chunks=F('chunks') + 1,
+                penalized=F('penalized') + penalized,
+                notified=F('notified') + len(notify),
+            )
+    return penalized, len(notify)
+
+
+def run_enforcement(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None, mark=None, run=None):
+    """Apply the midnight penalty with set-based UPDATEs, one transaction per id range.
+
+    ``on_chunk``, ``mark`` and ``run`` are passed through to ``penalize_range``; with a run,
+    processing resumes after its last committed checkpoint.
+    """
+    if queryset is None:
+        queryset = enforceable_profiles()
+    summary = {'chunks': 0, 'penalized': 0, 'notified': 0}
+    after = run.last_profile_id if run is not None else None
+    for start, stop in iter_id_ranges(queryset, chunk_size, after):
+        penalized, notified = penalize_range(queryset, start, stop, on_chunk, mark, run)
+        summary['chunks'] += 1
+        summary['penalized'] += penalized
+        summary['notified'] += notified
+    return summary
+
+
+def run_shard(shard, shard_count, chunk_size=DEFAULT_CHUNK_SIZE, run_date=None):
+    """Enforce one hash partition for ``run_date`` and queue its pushes.
+
+    Progress is checkpointed in an EnforcementRun keyed by (run_date, shard, shard_count), so a
+    restarted run resumes after its last committed chunk. Profiles are also stamped with
+    ``last_enforced_on``, so even a rerun with a different shard layout never penalizes twice.
+    Returns the cumulative summary of the run, or an empty one flagged ``already_finished``
+    if the run had completed before.
+    """
+    run_date = run_date or timezone.localdate()
+    run, _ = EnforcementRun.objects.get_or_create(run_date=run_date, shard=shard, shard_count=shard_count)
+    if run.finished_at is not None:
+        return {'chunks': 0, 'penalized': 0, 'notified': 0, 'resumed': 0, 'already_finished': 1}
+    resumed = run.chunks > 0
+    queryset = enforceable_profiles(shard, shard_count).filter(due_on(run_date))
+    run_enforcement(queryset, chunk_size, queue_penalty_notifications, {'last_enforced_on': run_date}, run)
+    EnforcementRun.objects.filter(pk=run.pk).update(finished_at=timezone.now())
+    run.refresh_from_db()
+    return {
+        'chunks': run.chunks,
+        'penalized': run.penalized,
+        'notified': run.notified,
+        'resumed': int(resumed),
+        'already_finished': 0,
+    }
+
+
+def merge_summaries(summaries):
+    merged = {}
+    for summary in summaries:
+        for key, value in summary.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _init_worker():
+    import django
+    django.setup()
+    # Forked children must not reuse the parent's socket; each opens its own connection
+    connections.close_all()
+
+
+def _run_shard_in_worker(args):
+    try:
+        # SQL runs in the child, so it is counted here and merged into the parent's summary
+        with metrics.track_queries() as stats:
+            summary = run_shard(*args)
+        summary.update(queries=stats.count, sql_seconds=stats.duration)
+        return summary
+    finally:
+        connections.close_all()
+
+
+def run_sharded(shard=0, shard_count=1, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, run_date=None):
+    """Split shard ``shard``/``shard_count`` into ``workers`` sub-shards run in a process pool."""
+    run_date = run_date or timezone.localdate()
+    if workers <= 1:
+        return run_shard(shard, shard_count, chunk_size, run_date)
+    # pk % shard_count == shard  <=>  pk % (shard_count * workers) == shard + w * shard_count for some w
+    total = shard_count * workers
+    jobs = [(shard + w * shard_count, total, chunk_size, run_date) for w in range(workers)]
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        return merge_summaries(pool.map(_run_shard_in_worker, jobs))
+
+
+def due_timezones(now, window):
+    """Group the timezones in use by local date, keeping those whose local midnight passed
+    less than ``window`` ago."""
+    groups = defaultdict(list)
+    names = DisciplineProfile.objects.order_by().values_list('timezone', flat=True).distinct()
+    for name in names:
+        try:
+            local = now.astimezone(ZoneInfo(name))
+        except (ZoneInfoNotFoundError, ValueError):
+            continue
+        midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        if local - midnight < window:
+            groups[local.date()].append(name)
+    return groups
+
+
+def run_due_timezones(now=None, window=timedelta(hours=1), chunk_size=DEFAULT_CHUNK_SIZE):
+    """Enforce the profiles whose local midnight just passed.
+
+    Profiles are stamped with ``last_enforced_on`` in the same transaction as their penalty,
+    so re-running a bucket, or overlapping windows, never penalizes a profile twice per day.
+    """
+    now = now or timezone.now()
+    summaries = [{'chunks': 0, 'penalized': 0, 'notified': 0, 'timezones': 0}]
+    for local_date, names in due_timezones(now, window).items():
+        queryset = enforceable_profiles().filter(timezone__in=names).filter(due_on(local_date))
+        summary = run_enforcement(queryset, chunk_size, queue_penalty_notifications, {'last_enforced_on': local_date})
+        summary['timezones'] = len(names)
+        summaries.append(summary)
+    return merge_summaries(summaries)
\ No newline at end of file
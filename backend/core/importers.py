@@ -0,0 +1,78 @@
+import codecs
+import csv
+import json
+from django.conf import settings
+from django.db import transaction
+from .models import AdaptiveTask, Milestone
+from .serializers import TaskSerializer
+from .versioning import bump_profile
+
+CHUNK_SIZE = 500
+
+
+class ImportRowError(Exception):
+    def __init__(self, line, errors):
+        super().__init__(f'Line {line}: {errors}')
+        self.line = line
+        self.errors = errors
+
+
+def iter_jsonl(lines):
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ImportRowError(number, str(e))
+
+
+def iter_csv(lines):
+    # Columns: title, micro_version, difficulty_weight, milestones (titles separated by "|")
+    for number, row in enumerate(csv.DictReader(lines), start=2):
+        milestones = [title.strip() for title in (row.pop('milestones', '') or '').split('|') if title.strip()]
+        row = {key: value for key, value in row.items() if key and value not in (None, '')}
+        yield number, dict(row, milestones=[{'title': title} for title in milestones])
+
+
+def import_tasks(profile_id, upload, fmt):
+    """Stream an uploaded JSON-lines or CSV file of tasks (with nested milestones) into
+    profile ``profile_id``, inserting in chunks of CHUNK_SIZE. The whole import is one transaction: any
+    invalid row rolls it back. Returns (tasks, milestones) inserted."""
+    lines = codecs.iterdecode(upload, 'utf-8')
+    rows = iter_csv(lines) if fmt == 'csv' else iter_jsonl(lines)
+    max_rows = getattr(settings, 'TASK_IMPORT_MAX_ROWS', 10000)
+    totals = [0, 0]
+    chunk = []
+    with transaction.atomic():
+        for number, data in rows:
+            serializer = TaskSerializer(data=data)
+            if not serializer.is_valid():
+                raise ImportRowError(number, serializer.errors)
+            chunk.append(serializer.validated_data)
+            if totals[0] + len(chunk) > max_rows:
+                raise ImportRowError(number, f'Imports are limited to {max_rows} tasks.')
+            if len(chunk) >= CHUNK_SIZE:
+                insert_chunk(profile_id, chunk, totals)
+                chunk = []
+        if chunk:
+            insert_chunk(profile_id, chunk, totals)
+        bump_profile(profile_id)  # bulk_create sends no post_save
+    return tuple(totals)
+
+
+def insert_chunk(profile_id, chunk, totals):
+    milestones_data = [task.pop('milestones', []) for task in chunk]
+    tasks = [AdaptiveTask(profile_id=profile_id, **task) for task in chunk]
+    for task in tasks:
+        # bulk_create skips save(), so derive the level here
+        task.required_level = AdaptiveTask.parse_required_level(task.micro_version)
+    AdaptiveTask.objects.bulk_create(tasks)
+    milestones = [
+        Milestone(task=task, **milestone)
+        for task, items in zip(tasks, milestones_data)
+        for milestone in items
+    ]
+    Milestone.objects.bulk_create(milestones, batch_size=CHUNK_SIZE)
+    totals[0] += len(tasks)
+    totals[1] += len(milestones)
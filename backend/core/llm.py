@@ -0,0 +1,245 @@
+"""Process-wide access to the upstream model.
+
+``session()`` hands out a shared ``AsyncOpenAI`` client (one per event loop and
+configuration, so TLS connections are reused across requests) behind two guards: a
+concurrency bulkhead capping in-flight upstream calls, and a circuit breaker that stops
+calling a failing upstream for a cooldown. Callers fall back to ``fallback_message()``
+when either rejects a call with ``LLMUnavailable``.
+
+Both guards are process-wide. Under ASGI every request shares the server's loop and so its
+client; under WSGI (runserver) each async view runs on a loop of its own, whose client is
+closed when that loop shuts down.
+"""
+import asyncio
+import collections
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+from django.conf import settings
+from . import metrics
+
+calls = metrics.register(metrics.Counter('sentinl_llm_calls_total', 'Upstream model calls, by outcome.'))
+call_latency = metrics.register(metrics.Histogram('sentinl_llm_call_duration_seconds', 'Upstream model call latency.', metrics.LATENCY_BUCKETS))
+breaker_transitions = metrics.register(metrics.Counter('sentinl_llm_breaker_transitions_total', 'Circuit breaker state changes, by new state.'))
+
+DEFAULT_FALLBACK_MESSAGE = (
+    "I can't reach my coaching brain right now. Pick the smallest version of your next task "
+    "and do just that; I'll be back shortly."
+)
+
+
+class LLMUnavailable(Exception):
+    """The call was rejected before reaching the upstream (breaker open or bulkhead full)."""
+
+
+def fallback_message():
+    return getattr(settings, 'LLM_FALLBACK_MESSAGE', DEFAULT_FALLBACK_MESSAGE)
+
+
+def is_upstream_failure(exc):
+    import openai
+    # Connection errors include timeouts; 4xx other than 429 are our fault and do not trip the breaker
+    return isinstance(exc, (openai.APIConnectionError, openai.InternalServerError, openai.RateLimitError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive upstream failures and rejects calls for
+    ``cooldown`` seconds; then lets a single trial call through (half-open), whose outcome
+    closes or re-opens it. Shared by every thread and event loop in the process."""
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def transition(self, state):
+        self.state = state
+        breaker_transitions.inc(state=state)
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.transition(self.HALF_OPEN)
+                return True  # the trial call
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                self.transition(self.CLOSED)
+
+    def record_abandoned(self):
+        # A cancelled call says nothing about the upstream; a cancelled trial re-opens the
+        # breaker for a fresh cooldown instead of leaving it half-open for good
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.opened_at = time.monotonic()
+                self.transition(self.OPEN)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                if self.state != self.OPEN:
+                    self.transition(self.OPEN)
+
+
+class Bulkhead:
+    """Caps in-flight calls at LLM_MAX_CONCURRENCY across every thread and event loop in the
+    process; an asyncio.Semaphore would only count the calls on its own loop.
+
+    Waiters park on a future in a FIFO; ``release`` hands the slot straight to the oldest
+    one, waking it on its own loop.
+    """
+
+    def __init__(self):
+        self.in_use = 0
+        self.waiters = collections.deque()  # (loop, future), oldest first
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def limit():
+        return getattr(settings, 'LLM_MAX_CONCURRENCY', 16)
+
+    async def acquire(self, timeout):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if not self.waiters and self.in_use < self.limit():
+                self.in_use += 1
+                return True
+            waiter = (loop, loop.create_future())
+            self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self.lock:
+                handed_over = waiter not in self.waiters
+                if not handed_over:
+                    self.waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                return handed_over  # a slot handed over just as the wait ran out is still ours
+            if handed_over:
+                self.release()
+            raise
+
+    def release(self):
+        with self.lock:
+            if self.waiters and self.in_use <= self.limit():
+                loop, future = self.waiters.popleft()  # the slot passes on, in_use is unchanged
+                loop.call_soon_threadsafe(wake, future)
+            else:
+                self.in_use -= 1
+
+
+def wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def close_on_shutdown(clients):
+    # Stays suspended for the loop's lifetime: asyncio.run, which async_to_sync uses for every
+    # request under WSGI, finalizes async generators before closing the loop
+    try:
+        yield
+    finally:
+        for client in clients.values():
+            await client.close()
+
+
+class LLMClientManager:
+    def __init__(self):
+        self.breaker = CircuitBreaker(
+            getattr(settings, 'LLM_BREAKER_THRESHOLD', 5),
+            getattr(settings, 'LLM_BREAKER_COOLDOWN', 30),
+        )
+        self.bulkhead = Bulkhead()
+        # AsyncOpenAI's connection pool is bound to the loop that first uses it; keep the
+        # clients per loop, closed and dropped with the loop
+        self.per_loop = weakref.WeakKeyDictionary()
+
+    def config(self):
+        return (
+            settings.OPENAI_API_KEY,
+            getattr(settings, 'OPENAI_BASE_URL', None) or None,
+            getattr(settings, 'LLM_TIMEOUT', 30),
+            getattr(settings, 'LLM_CONNECT_TIMEOUT', 5),
+            getattr(settings, 'LLM_MAX_RETRIES', 1),
+        )
+
+    def clients(self):
+        loop = asyncio.get_running_loop()
+        state = self.per_loop.get(loop)
+        if state is None:
+            clients = {}
+            guard = close_on_shutdown(clients)
+            asyncio.ensure_future(guard.__anext__())
+            state = self.per_loop[loop] = {'clients': clients, 'guard': guard}
+        return state['clients']
+
+    def client(self):
+        import openai
+        clients = self.clients()
+        config = self.config()
+        client = clients.get(config)
+        if client is None:
+            api_key, base_url, timeout, connect_timeout, max_retries = config
+            client = clients[config] = openai.AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=openai.Timeout(timeout, connect=connect_timeout),
+                max_retries=max_retries,
+            )
+        return client
+
+    @asynccontextmanager
+    async def session(self):
+        """Yield the shared client for one upstream call (or one streamed reply)."""
+        bulkhead = self.bulkhead
+        if not await bulkhead.acquire(getattr(settings, 'LLM_QUEUE_TIMEOUT', 2)):
+            calls.inc(outcome='rejected')
+            raise LLMUnavailable('too many concurrent model calls')
+        # Ask the breaker only once holding a slot, so a half-open trial always reaches the
+        # finally below that resolves it
+        if not self.breaker.allow():
+            bulkhead.release()
+            calls.inc(outcome='short_circuited')
+            raise LLMUnavailable('circuit open')
+        started = time.perf_counter()
+        resolve = self.breaker.record_abandoned
+        try:
+            yield self.client()
+            resolve = self.breaker.record_success
+            calls.inc(outcome='ok')
+        except Exception as e:
+            if is_upstream_failure(e):
+                resolve = self.breaker.record_failure
+                calls.inc(outcome='timeout' if 'Timeout' in type(e).__name__ else 'error')
+            else:
+                # Our own error (a 4xx, a missing API key): the upstream is not at fault
+                resolve = self.breaker.record_success
+                calls.inc(outcome='client_error')
+            raise
+        except BaseException:
+            calls.inc(outcome='cancelled')  # e.g. a streaming client disconnected
+            raise
+        finally:
+            resolve()
+            bulkhead.release()
+            call_latency.observe(time.perf_counter() - started)
+
+
+manager = LLMClientManager()
+session = manager.session
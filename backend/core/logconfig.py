@@ -0,0 +1,135 @@
+"""Structured, non-blocking logging.
+
+Loggers hand records to ``QueueingHandler``, which only puts them on a bounded queue; a
+``QueueListener`` thread formats them as JSON lines and writes them out. Secrets are
+redacted by the formatter and high-volume debug loggers are sampled by ``SamplingFilter``
+before anything is queued. Wired up by ``LOGGING`` in settings.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+REDACTED = '[REDACTED]'
+SENSITIVE_KEY = re.compile(r'authorization|token|password|secret|cookie|api[_-]?key', re.IGNORECASE)
+SENSITIVE_TEXT = [
+    (re.compile(r'\b(Token|Bearer)\s+[\w.~+/=-]+', re.IGNORECASE), r'\1 ' + REDACTED),
+    (re.compile(r'\bsk-[\w-]{8,}'), REDACTED),  # OpenAI keys
+    (re.compile(r'\b[0-9a-f]{40}\b'), REDACTED),  # DRF auth tokens
+]
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+
+def redact(value, key=None):
+    if key is not None and SENSITIVE_KEY.search(str(key)):
+        return REDACTED
+    if isinstance(value, str):
+        for pattern, replacement in SENSITIVE_TEXT:
+            value = pattern.sub(replacement, value)
+        return value
+    if hasattr(value, 'items'):  # dicts and header mappings
+        return {str(k): redact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [redact(v) for v in value]
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return redact(str(value))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any ``extra`` fields,
+    with secrets redacted."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': redact(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = redact(value, key)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = redact(record.exc_text)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of DEBUG records from the given loggers.
+
+    ``rates`` maps a logger name (and its children) to the fraction kept, e.g.
+    ``{'core.views': 0.01}``. INFO and above always pass.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+
+    def rate_for(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class DrainingQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # The queue is bounded; wait for the listener to make room instead of raising Full
+        self.queue.put(self._sentinel)
+
+
+class QueueingHandler(QueueHandler):
+    """Enqueues records for a background ``QueueListener`` that writes JSON lines to
+    ``stream``. A full queue drops the record (counted in ``dropped``) rather than block the
+    calling thread."""
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        target = logging.StreamHandler(stream or sys.stderr)
+        target.setFormatter(JsonFormatter())
+        self.listener = DrainingQueueListener(self.queue, target)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def prepare(self, record):
+        # Unlike the default prepare(), leave msg unformatted by any Formatter so the listener
+        # can emit it as JSON; the traceback is rendered now, while its frames are alive
+        record = logging.makeLogRecord(vars(record))
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        # Flushes what is queued; safe to call more than once
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        super().close()
@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from core.enforcement import run_due_timezones, DEFAULT_CHUNK_SIZE
+
+class Command(BaseCommand):
+    help = 'Enforces each timezone bucket shortly after its local midnight, spreading the nightly load over 24 hours'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=15,
+                            help='Minutes between bucket runs')
+        parser.add_argument('--window', type=int, default=60,
+                            help='Minutes after local midnight during which a timezone is still due')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Number of profile ids covered by each UPDATE/transaction')
+        parser.add_argument('--once', action='store_true',
+                            help='Run a single bucket pass and exit (for cron)')
+
+    def handle(self, *args, **options):
+        window = timedelta(minutes=max(options['window'], options['interval']))
+        while True:
+            started = time.monotonic()
+            summary = run_due_timezones(window=window, chunk_size=options['chunk_size'])
+            if summary['timezones']:
+                self.stdout.write(
+                    f"Enforced {summary['timezones']} timezone(s): penalized {summary['penalized']} profiles "
+                    f"in {summary['chunks']} chunks ({time.monotonic() - started:.2f}s); "
+                    f"queued {summary['notified']} pushes"
+                )
+            if options['once']:
+                break
+            time.sleep(max(0, options['interval'] * 60 - (time.monotonic() - started)))
@@ -1,38 +1,53 @@
-import requests
-from django.core.management.base import BaseCommand
-from core.models import DisciplineProfile, AdaptiveTask
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from core import metrics
+from core.enforcement import run_sharded, DEFAULT_CHUNK_SIZE
+
+def parse_shard(value):
+    try:
+        shard, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise CommandError(f"Invalid --shard '{value}', expected i/N")
+    if count < 1 or not 0 <= shard < count:
+        raise CommandError(f"Invalid --shard '{value}', expected 0 <= i < N")
+    return shard, count
 
 class Command(BaseCommand):
     help = 'Midnight Enforcer: Resets streaks and damages avatar health for missed tasks'
 
-    def send_push_notification(self, token, title, body):
-        if not token:
-            return
-        url = 'https://exp.host/--/api/v2/push/send'
-        data = {
-            'to': token,
-            'title': title,
-            'body': body,
-        }
-        try:
-            response = requests.post(url, json=data)
-            self.stdout.write(f"Push sent to {token}: {response.status_code}")
-        except Exception as e:
-            self.stdout.write(f"Failed to send push: {e}")
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Number of profile ids covered by each UPDATE/transaction')
+        parser.add_argument('--shard', default='0/1',
+                            help='Only enforce profiles with id %% N == i, given as i/N')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Split the shard across N processes, each with its own DB connection')
+        parser.add_argument('--date', type=date.fromisoformat, default=None,
+                            help='Enforcement date (YYYY-MM-DD) used to resume or re-run; defaults to today')
+        parser.add_argument('--metrics-file', default=None,
+                            help='Write the run metrics in Prometheus text format, e.g. for the node_exporter textfile collector')
 
     def handle(self, *args, **options):
-        profiles = DisciplineProfile.objects.filter(is_in_sickness_mode=False)
-        
-        for profile in profiles:
-            if AdaptiveTask.objects.filter(profile=profile, is_completed=False, is_micro_completed=False).exists():
-                old_health = profile.avatar_health
-                profile.current_streak = 0
-                profile.avatar_health = max(0, profile.avatar_health - 20)
-                profile.save()
-                self.stdout.write(f"Penalized {profile.user.username}: health {old_health} -> {profile.avatar_health}")
-                if profile.push_token:
-                    self.send_push_notification(
-                        profile.push_token,
-                        'Avatar Damaged!',
-                        f'Your avatar health dropped to {profile.avatar_health}% due to missed tasks.'
-                    )
\ No newline at end of file
+        shard, shard_count = parse_shard(options['shard'])
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        started = time.perf_counter()
+        with metrics.track_queries() as stats:
+            summary = run_sharded(shard, shard_count, options['workers'], options['chunk_size'], options['date'])
+        elapsed = time.perf_counter() - started
+        stats.count += summary.pop('queries', 0)
+        stats.duration += summary.pop('sql_seconds', 0)
+        metrics.observe('command:enforcer', elapsed, stats)
+        if summary['already_finished']:
+            self.stdout.write(f"Skipped {summary['already_finished']} run(s) already finished for this date")
+        if summary['resumed']:
+            self.stdout.write(f"Resumed {summary['resumed']} checkpointed run(s)")
+        self.stdout.write(
+            f"Shard {shard}/{shard_count}: penalized {summary['penalized']} profiles in {summary['chunks']} chunks "
+            f"across {options['workers']} worker(s) ({elapsed:.2f}s); queued {summary['notified']} pushes"
+        )
+        self.stdout.write(f"SQL: {stats.count} queries in {stats.duration:.2f}s")
+        if options['metrics_file']:
+            with open(options['metrics_file'], 'w') as f:
+                f.write(metrics.render())
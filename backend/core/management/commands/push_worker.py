@@ -0,0 +1,29 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.push import PushDispatcher, claim_pushes, deliver_pushes
+
+class Command(BaseCommand):
+    help = 'Delivers queued push notifications from the outbox, retrying failures with exponential backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'PUSH_WORKER_BATCH_SIZE', 500),
+                            help='Number of outbox rows claimed per round')
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Seconds to sleep when nothing is due')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no rows are due instead of polling forever')
+
+    def handle(self, *args, **options):
+        totals = [0, 0, 0]
+        with PushDispatcher() as dispatcher:
+            while True:
+                rows = claim_pushes(options['batch_size'])
+                if not rows:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                for i, count in enumerate(deliver_pushes(dispatcher, rows)):
+                    totals[i] += count
+        self.stdout.write(f"Pushes sent={totals[0]} retrying={totals[1]} failed={totals[2]}")
@@ -0,0 +1,105 @@
+"""Bounded conversation memory for the AI coach.
+
+Each profile keeps its last COACH_MEMORY_TURNS turns verbatim. Older turns are folded into
+a rolling summary of short extractive lines, capped at COACH_SUMMARY_TOKENS; this costs no
+second model call. ``build_messages`` assembles the system prompt, the profile's current
+stats, the summary and as many recent turns as fit in COACH_PROMPT_TOKEN_BUDGET, so the
+prompt stays bounded however long the conversation runs.
+"""
+import re
+from django.conf import settings
+from django.db.models import Count, Q
+from .models import CoachMemory, DisciplineProfile
+
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators per chat message
+SUMMARY_LINE_WORDS = 25
+MAX_STORED_CHARS = 2000
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English; close enough to budget without a tokenizer
+    return (len(text) + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+def stats_line(profile):
+    line = (
+        f"The user's current stats: level {profile.level}, discipline score {profile.discipline_score}/100, "
+        f"streak {profile.current_streak} days, avatar health {profile.avatar_health}%, "
+        f"{profile.open_tasks} open tasks"
+    )
+    return line + (", currently in sickness mode." if profile.is_in_sickness_mode else ".")
+
+
+def summary_line(turn):
+    first_sentence = re.split(r'(?<=[.!?])\s', turn['content'].strip(), maxsplit=1)[0]
+    words = first_sentence.split()
+    text = ' '.join(words[:SUMMARY_LINE_WORDS]) + ('...' if len(words) > SUMMARY_LINE_WORDS else '')
+    return f"- {'User' if turn['role'] == 'user' else 'Coach'}: {text}"
+
+
+def compact(summary, budget):
+    lines = [line for line in summary.splitlines() if line]
+    while lines and estimate_tokens('\n'.join(lines)) > budget:
+        lines.pop(0)  # the oldest context goes first
+    return '\n'.join(lines)
+
+
+async def load(user):
+    """Return ``(profile, memory)`` for ``user``, with ``profile.open_tasks`` annotated, or
+    ``(None, None)`` if the user has no profile."""
+    profile = await DisciplineProfile.objects.filter(user_id=user.pk).annotate(
+        open_tasks=Count('tasks', filter=Q(tasks__deleted_at__isnull=True, tasks__is_completed=False, tasks__is_micro_completed=False)),
+    ).afirst()
+    if profile is None:
+        return None, None
+    memory, _ = await CoachMemory.objects.aget_or_create(profile=profile)
+    return profile, memory
+
+
+def is_empty(memory):
+    """Whether the coach knows nothing of the conversation yet: no turns and no summary."""
+    return memory is None or not (memory.turns or memory.summary)
+
+
+def build_messages(profile, memory, message, system_prompt, budget=None):
+    budget = budget or getattr(settings, 'COACH_PROMPT_TOKEN_BUDGET', 1000)
+    system = system_prompt
+    if profile is not None:
+        system += '\n\n' + stats_line(profile)
+    used = estimate_tokens(system)
+    # The message always goes in; one too long for the budget is cut down to what is left
+    room = max(budget - used - MESSAGE_OVERHEAD_TOKENS, 1) * 4
+    message = message[:room]
+    used += estimate_tokens(message)
+    if memory is not None and memory.summary:
+        block = '\n\nEarlier in this conversation:\n' + memory.summary
+        if used + estimate_tokens(block) - MESSAGE_OVERHEAD_TOKENS <= budget:
+            system += block
+            used += estimate_tokens(block) - MESSAGE_OVERHEAD_TOKENS
+    history = []
+    for turn in reversed(memory.turns if memory is not None else []):
+        cost = estimate_tokens(turn['content'])
+        if used + cost > budget:
+            break
+        history.append(turn)
+        used += cost
+    return [
+        {'role': 'system', 'content': system},
+        *reversed(history),
+        {'role': 'user', 'content': message},
+    ]
+
+
+async def remember(memory, message, reply):
+    """Append an exchange, folding turns beyond COACH_MEMORY_TURNS into the summary."""
+    keep = getattr(settings, 'COACH_MEMORY_TURNS', 8)
+    turns = memory.turns + [
+        {'role': 'user', 'content': message[:MAX_STORED_CHARS]},
+        {'role': 'assistant', 'content': reply[:MAX_STORED_CHARS]},
+    ]
+    overflow, memory.turns = turns[:-keep], turns[-keep:]
+    if overflow:
+        lines = [memory.summary] + [summary_line(turn) for turn in overflow]
+        memory.summary = compact('\n'.join(lines), getattr(settings, 'COACH_SUMMARY_TOKENS', 200))
+    memory.exchanges += 1
+    await memory.asave(update_fields=['turns', 'summary', 'exchanges', 'updated_at'])
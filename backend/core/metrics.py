@@ -0,0 +1,134 @@
+import bisect
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from django.db import connections
+
+# Seconds; covers a cached 304 up to a slow enforcer chunk
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in labels)
+    return '{%s}' % pairs
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name, self.help = name, help
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield f'{self.name}{format_labels(key)} {value}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format; observe() is a
+    bisect and three additions under a lock."""
+
+    def __init__(self, name, help, buckets):
+        self.name, self.help = name, help
+        self.buckets = tuple(buckets)
+        self.series = {}  # label key -> [bucket counts..., +Inf count], sum
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, **labels):
+        series = self.series.get(tuple(sorted(labels.items())))
+        return sum(series[0]) if series else 0
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self.lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self.series.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{format_labels((*key, ("le", bound)))} {cumulative}'
+            yield f'{self.name}_sum{format_labels(key)} {total}'
+            yield f'{self.name}_count{format_labels(key)} {cumulative}'
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render():
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+
+requests_total = register(Counter('sentinl_requests_total', 'Requests handled, by view, method and status.'))
+request_latency = register(Histogram('sentinl_request_duration_seconds', 'Total request latency.', LATENCY_BUCKETS))
+request_queries = register(Histogram('sentinl_request_db_queries', 'SQL statements per request.', QUERY_COUNT_BUCKETS))
+request_db_time = register(Histogram('sentinl_request_db_duration_seconds', 'Time spent in SQL per request.', LATENCY_BUCKETS))
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+@contextmanager
+def track_queries():
+    """Count and time every SQL statement run by this thread inside the block, on all
+    configured databases."""
+    stats = QueryStats()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(stats))
+        yield stats
+
+
+def observe(view, elapsed, stats=None):
+    request_latency.observe(elapsed, view=view)
+    if stats is not None:
+        request_queries.observe(stats.count, view=view)
+        request_db_time.observe(stats.duration, view=view)
+
+
+def server_timing(elapsed, stats=None):
+    total = f'total;dur={elapsed * 1000:.1f}'
+    if stats is None:
+        return total
+    return f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries", {total}'
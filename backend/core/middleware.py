@@ -0,0 +1,60 @@
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from . import metrics
+
+
+class RequestMetricsMiddleware:
+    """Records latency, SQL count and SQL time per view into the histograms served at
+    /metrics, and optionally as a Server-Timing header (METRICS_SERVER_TIMING).
+
+    Async-capable so it does not force async views back onto a thread. On that path the view
+    runs in sync_to_async calls (sync views, the async ORM), so SQL tracking starts in
+    process_view, which Django runs the same way, and ends once the response is back.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'METRICS_SERVER_TIMING', False)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with metrics.track_queries() as stats:
+            response = self.get_response(request)
+        return self.record(request, response, time.perf_counter() - started, stats)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        tracking = getattr(request, '_query_tracking', None)
+        stats = None
+        if tracking is not None:
+            stats = tracking.stats
+            await sync_to_async(tracking.close)()
+        return self.record(request, response, time.perf_counter() - started, stats)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Sync, so under ASGI Django calls it through sync_to_async like the view itself; the
+        # execute wrappers land on the connections the view's queries then run on
+        if self.async_mode:
+            tracking = request._query_tracking = ExitStack()
+            tracking.stats = tracking.enter_context(metrics.track_queries())
+        return None
+
+    def record(self, request, response, elapsed, stats):
+        match = request.resolver_match
+        # The URL name keeps label cardinality bounded, unlike the raw path
+        view = match.view_name if match else '<unmatched>'
+        metrics.observe(view, elapsed, stats)
+        metrics.requests_total.inc(view=view, method=request.method, status=response.status_code)
+        if self.server_timing:
+            response['Server-Timing'] = metrics.server_timing(elapsed, stats)
+        return response
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_pushoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disciplineprofile',
+            name='last_enforced_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='disciplineprofile',
+            name='timezone',
+            field=models.CharField(default='UTC', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='disciplineprofile',
+            index=models.Index(fields=['timezone', 'last_enforced_on'], name='profile_tz_enforced_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_disciplineprofile_last_enforced_on_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnforcementRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_date', models.DateField()),
+                ('shard', models.IntegerField(default=0)),
+                ('shard_count', models.IntegerField(default=1)),
+                ('last_profile_id', models.BigIntegerField(blank=True, null=True)),
+                ('chunks', models.IntegerField(default=0)),
+                ('penalized', models.IntegerField(default=0)),
+                ('notified', models.IntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('run_date', 'shard', 'shard_count'), name='unique_enforcement_run')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:51
+
+from django.db import migrations, models
+
+
+def parse_required_level(micro_version):
+    # Frozen copy of AdaptiveTask.parse_required_level at the time of this migration
+    try:
+        return min(max(int(micro_version.split('.')[1]) + 1, 1), 32767)
+    except (AttributeError, IndexError, ValueError):
+        return 1
+
+
+def backfill_required_level(apps, schema_editor):
+    AdaptiveTask = apps.get_model('core', 'AdaptiveTask')
+    batch = []
+    for task in AdaptiveTask.objects.only('id', 'micro_version').iterator(chunk_size=2000):
+        level = parse_required_level(task.micro_version)
+        if level != 1:
+            task.required_level = level
+            batch.append(task)
+        if len(batch) >= 2000:
+            AdaptiveTask.objects.bulk_update(batch, ['required_level'])
+            batch = []
+    if batch:
+        AdaptiveTask.objects.bulk_update(batch, ['required_level'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_enforcementrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adaptivetask',
+            name='required_level',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddIndex(
+            model_name='adaptivetask',
+            index=models.Index(fields=['profile', 'required_level'], name='task_profile_level_idx'),
+        ),
+        migrations.RunPython(backfill_required_level, migrations.RunPython.noop),
+    ]
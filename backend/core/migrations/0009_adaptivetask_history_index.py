@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_adaptivetask_required_level'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adaptivetask',
+            index=models.Index(fields=['profile', '-created_at', '-id'], name='task_profile_history_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:54
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def dedupe_and_record_unlocks(apps, schema_editor):
+    Achievement = apps.get_model('core', 'Achievement')
+    DisciplineProfile = apps.get_model('core', 'DisciplineProfile')
+    unlocked = defaultdict(set)
+    duplicates = []
+    for pk, profile_id, name in Achievement.objects.order_by('unlocked_at', 'id').values_list('id', 'profile_id', 'name').iterator():
+        if name in unlocked[profile_id]:
+            duplicates.append(pk)
+        else:
+            unlocked[profile_id].add(name)
+    # Keep the earliest unlock of each name so the unique constraint can be added
+    Achievement.objects.filter(pk__in=duplicates).delete()
+    profiles = list(DisciplineProfile.objects.filter(pk__in=unlocked).only('id'))
+    for profile in profiles:
+        profile.unlocked_achievements = sorted(unlocked[profile.pk])
+    DisciplineProfile.objects.bulk_update(profiles, ['unlocked_achievements'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_adaptivetask_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disciplineprofile',
+            name='unlocked_achievements',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(dedupe_and_record_unlocks, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='achievement',
+            constraint=models.UniqueConstraint(fields=('profile', 'name'), name='unique_profile_achievement'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_achievement_registry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='achievement',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='achievement',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='adaptivetask',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='adaptivetask',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='milestone',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='milestone',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='achievement',
+            index=models.Index(fields=['profile', 'updated_at'], name='achievement_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adaptivetask',
+            index=models.Index(fields=['profile', 'updated_at'], name='task_profile_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='milestone',
+            index=models.Index(fields=['task', 'updated_at'], name='milestone_task_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_sync_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disciplineprofile',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
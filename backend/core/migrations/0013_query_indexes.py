@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0012_profile_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adaptivetask',
+            index=models.Index(fields=['profile', 'is_completed', 'is_micro_completed'], name='task_profile_open_idx'),
+        ),
+        # auth_user belongs to django.contrib.auth, so its expression index for the
+        # case-insensitive email lookups in login/register is created with raw SQL
+        migrations.RunSQL(
+            'CREATE INDEX auth_user_email_lower_idx ON auth_user (LOWER(email));',
+            reverse_sql='DROP INDEX auth_user_email_lower_idx;',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disciplineprofile',
+            name='coach_cache_opt_out',
+            field=models.BooleanField(default=False),
+        ),
+    ]
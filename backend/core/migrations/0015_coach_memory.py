@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_coach_cache_opt_out'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoachMemory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('summary', models.TextField(blank=True)),
+                ('turns', models.JSONField(blank=True, default=list)),
+                ('exchanges', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='coach_memory', to='core.disciplineprofile')),
+            ],
+        ),
+    ]
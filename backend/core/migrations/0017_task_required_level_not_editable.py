@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_pushoutbox_lease_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='adaptivetask',
+            name='required_level',
+            field=models.PositiveSmallIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 class DisciplineProfile(models.Model):
@@ -8,49 +9,173 @@ class DisciplineProfile(models.Model):
     avatar_health = models.IntegerField(default=100)
     is_in_sickness_mode = models.BooleanField(default=False)
     push_token = models.CharField(max_length=255, blank=True, null=True)
+    timezone = models.CharField(max_length=64, default='UTC')
+    last_enforced_on = models.DateField(null=True, blank=True)  # local date of the last midnight enforcement
+    unlocked_achievements = models.JSONField(default=list, blank=True)  # names, mirrors the Achievement rows
+    version = models.BigIntegerField(default=0)  # bumped on every write to the profile or its rows, drives ETags
+    coach_cache_opt_out = models.BooleanField(default=False)  # never serve or store this user's coach replies from the cache
+
+    class Meta:
+        indexes = [models.Index(fields=['timezone', 'last_enforced_on'], name='profile_tz_enforced_idx')]
 
     @property
     def level(self):
         return (self.discipline_score // 10) + 1
 
+    def save(self, *args, **kwargs):
+        # version only ever advances in SQL (see core.versioning); never write back a stale copy
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields
+                                       if not f.primary_key and f.name != 'version']
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user.username}'s Identity"
 
-class AdaptiveTask(models.Model):
+class LiveManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+class SyncedModel(models.Model):
+    """Change tracking for /api/sync/: every write bumps updated_at and deletes leave a tombstone.
+
+    QuerySet.update() and bulk_update() skip auto_now, so callers using them must set updated_at.
+    """
+    updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()  # includes tombstones
+
+    class Meta:
+        abstract = True
+
+    def soft_delete(self):
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at', 'updated_at'])
+
+class AdaptiveTask(SyncedModel):
     profile = models.ForeignKey(DisciplineProfile, on_delete=models.CASCADE, related_name="tasks")
     title = models.CharField(max_length=255)
     micro_version = models.CharField(max_length=255)
     is_completed = models.BooleanField(default=False)
     is_micro_completed = models.BooleanField(default=False)
     difficulty_weight = models.IntegerField(default=1) # 1-5 scale
+    required_level = models.PositiveSmallIntegerField(default=1, editable=False)  # derived from micro_version on save
     created_at = models.DateTimeField(auto_now_add=True)
 
-    @property
-    def required_level(self):
+    class Meta:
+        indexes = [
+            models.Index(fields=['profile', 'required_level'], name='task_profile_level_idx'),
+            models.Index(fields=['profile', '-created_at', '-id'], name='task_profile_history_idx'),
+            models.Index(fields=['profile', 'updated_at'], name='task_profile_updated_idx'),
+            models.Index(fields=['profile', 'is_completed', 'is_micro_completed'], name='task_profile_open_idx'),
+        ]
+
+    @staticmethod
+    def parse_required_level(micro_version):
         # Parse micro_version like 'v1.0' -> 1, 'v1.1' -> 2, etc.
         try:
-            version = self.micro_version.split('.')[1]  # 'v1.0' -> '0', 'v1.1' -> '1'
-            return int(version) + 1
-        except (IndexError, ValueError):
+            version = micro_version.split('.')[1]  # 'v1.0' -> '0', 'v1.1' -> '1'
+            return min(max(int(version) + 1, 1), 32767)  # clamp to the column's range
+        except (AttributeError, IndexError, ValueError):
             return 1  # default to 1
 
+    def save(self, *args, **kwargs):
+        self.required_level = self.parse_required_level(self.micro_version)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'micro_version' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'required_level'}
+        super().save(*args, **kwargs)
+
+    def soft_delete(self):
+        # The task's milestones go with it, each leaving its own tombstone
+        with transaction.atomic():
+            self.milestones.update(deleted_at=timezone.now(), updated_at=timezone.now())
+            super().soft_delete()
+
     def __str__(self):
         return self.title
 
-class Milestone(models.Model):
+class Milestone(SyncedModel):
     task = models.ForeignKey(AdaptiveTask, on_delete=models.CASCADE, related_name="milestones")
     title = models.CharField(max_length=255)
     completed = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['task', 'updated_at'], name='milestone_task_updated_idx')]
+
     def __str__(self):
         return f"{self.task.title}: {self.title}"
 
-class Achievement(models.Model):
+class Achievement(SyncedModel):
     profile = models.ForeignKey(DisciplineProfile, on_delete=models.CASCADE, related_name="achievements")
     name = models.CharField(max_length=255)
     description = models.TextField()
     unlocked_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['profile', 'name'], name='unique_profile_achievement')]
+        indexes = [models.Index(fields=['profile', 'updated_at'], name='achievement_updated_idx')]
+
+    def __str__(self):
+        return f"{self.profile.user.username}: {self.name}"
+
+class PushOutbox(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (FAILED, 'Failed')]
+
+    profile = models.ForeignKey(DisciplineProfile, on_delete=models.CASCADE, related_name="push_messages", null=True, blank=True)
+    token = models.CharField(max_length=255)
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    data = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    lease_id = models.UUIDField(null=True, blank=True)  # set by the worker that last claimed the row
+    last_error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='pushoutbox_due_idx')]
+
+    def __str__(self):
+        return f"{self.title} -> {self.token} ({self.status})"
+
+
+class EnforcementRun(models.Model):
+    run_date = models.DateField()
+    shard = models.IntegerField(default=0)
+    shard_count = models.IntegerField(default=1)
+    last_profile_id = models.BigIntegerField(null=True, blank=True)  # checkpoint: highest id of the last committed chunk
+    chunks = models.IntegerField(default=0)
+    penalized = models.IntegerField(default=0)
+    notified = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['run_date', 'shard', 'shard_count'], name='unique_enforcement_run'),
+        ]
+
+    def __str__(self):
+        return f"Enforcement {self.run_date} shard {self.shard}/{self.shard_count}"
+
+
+class CoachMemory(models.Model):
+    """The coach's memory of one profile's conversation: the most recent turns verbatim and
+    a compact summary of everything older, see core.memory."""
+    profile = models.OneToOneField(DisciplineProfile, on_delete=models.CASCADE, related_name="coach_memory")
+    summary = models.TextField(blank=True)
+    turns = models.JSONField(default=list, blank=True)  # [{'role': 'user' | 'assistant', 'content': ...}], oldest first
+    exchanges = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"{self.profile.user.username}: {self.name}"
\ No newline at end of file
+        return f"Coach memory for {self.profile}"
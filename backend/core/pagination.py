@@ -0,0 +1,45 @@
+import base64
+from datetime import datetime
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+
+class KeysetPagination:
+    """Cursor pagination over (created_at, id), newest first.
+
+    Each page is a single index range scan starting after the cursor, so the cost of a page
+    does not depend on how far into the history it is.
+    """
+    page_size = 50
+    max_page_size = 200
+
+    def encode_cursor(self, obj):
+        raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+            return datetime.fromisoformat(created_at), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({'cursor': 'Invalid cursor.'})
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get('page_size', self.page_size))
+        except ValueError:
+            raise ValidationError({'page_size': 'Must be an integer.'})
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request):
+        """Returns (page, next_cursor); next_cursor is None on the last page."""
+        queryset = queryset.order_by('-created_at', '-id')
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        size = self.get_page_size(request)
+        page = list(queryset[:size + 1])
+        if len(page) > size:
+            return page[:size], self.encode_cursor(page[size - 1])
+        return page, None
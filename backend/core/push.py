@@ -0,0 +1,166 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import DisciplineProfile, PushOutbox
+
+EXPO_PUSH_URL = 'https://exp.host/--/api/v2/push/send'
+EXPO_BATCH_LIMIT = 100  # Expo rejects requests with more than 100 messages
+
+# Ticket errors that will never succeed on retry
+INVALID_TOKEN_ERRORS = {'DeviceNotRegistered'}
+PERMANENT_ERRORS = INVALID_TOKEN_ERRORS | {'MessageTooBig', 'InvalidCredentials'}
+
+
+def batched(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class PushDispatcher:
+    """Sends Expo push messages in batches over a shared keep-alive session.
+
+    ``send`` returns one ticket dict per message, in order:
+    ``{'to': ..., 'status': 'ok' | 'error', 'error': <expo error code or None>, 'message': ...}``.
+    """
+
+    def __init__(self, endpoint=None, batch_size=None, concurrency=None, timeout=None):
+        self.endpoint = endpoint or getattr(settings, 'EXPO_PUSH_URL', EXPO_PUSH_URL)
+        self.batch_size = min(batch_size or getattr(settings, 'PUSH_BATCH_SIZE', EXPO_BATCH_LIMIT), EXPO_BATCH_LIMIT)
+        self.concurrency = concurrency or getattr(settings, 'PUSH_CONCURRENCY', 4)
+        self.timeout = timeout or getattr(settings, 'PUSH_TIMEOUT', 10)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'})
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def send(self, messages):
+        batches = list(batched(list(messages), self.batch_size))
+        if not batches:
+            return []
+        if len(batches) == 1 or self.concurrency == 1:
+            results = [self.send_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                results = list(pool.map(self.send_batch, batches))
+        return [ticket for tickets in results for ticket in tickets]
+
+    def send_batch(self, batch):
+        try:
+            response = self.session.post(self.endpoint, json=batch, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json().get('data', [])
+        except (requests.RequestException, ValueError) as e:
+            # Transport failure: every message in the batch is reported as failed
+            return [self.ticket(message, {'status': 'error', 'message': str(e), 'details': {'error': 'RequestFailed'}})
+                    for message in batch]
+        if isinstance(data, dict):
+            data = [data]
+        tickets = []
+        for i, message in enumerate(batch):
+            raw = data[i] if i < len(data) else {'status': 'error', 'message': 'Missing ticket', 'details': {}}
+            tickets.append(self.ticket(message, raw))
+        return tickets
+
+    @staticmethod
+    def ticket(message, raw):
+        details = raw.get('details') or {}
+        return {
+            'to': message.get('to'),
+            'status': raw.get('status', 'error'),
+            'error': details.get('error') if raw.get('status') != 'ok' else None,
+            'message': raw.get('message', ''),
+        }
+
+
+def enqueue_pushes(messages, batch_size=1000):
+    """Write push messages to the outbox in bulk. Each message is a dict with
+    ``to``, ``title``, ``body`` and optionally ``profile_id`` and ``data``."""
+    rows = [
+        PushOutbox(
+            profile_id=m.get('profile_id'),
+            token=m['to'],
+            title=m['title'],
+            body=m['body'],
+            data=m.get('data', {}),
+        )
+        for m in messages
+    ]
+    return PushOutbox.objects.bulk_create(rows, batch_size=batch_size)
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'PUSH_RETRY_BASE_SECONDS', 30)
+    cap = getattr(settings, 'PUSH_RETRY_MAX_SECONDS', 3600)
+    return timedelta(seconds=min(cap, base * 2 ** max(0, attempts - 1)))
+
+
+def claim_pushes(batch_size, lease_seconds=300):
+    """Claim due outbox rows. Claimed rows are leased by pushing next_attempt_at into the
+    future, so rows held by a crashed worker become due again once the lease expires.
+
+    The claim is a conditional UPDATE that re-checks the rows are still due and stamps them
+    with a fresh lease id; only rows carrying that id are returned, so two workers never
+    claim the same row, on any backend.
+    """
+    now = timezone.now()
+    lease_id = uuid.uuid4()
+    due = PushOutbox.objects.filter(status=PushOutbox.PENDING, next_attempt_at__lte=now)
+    ids = list(due.order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    claimed = due.filter(id__in=ids).update(
+        lease_id=lease_id,
+        attempts=F('attempts') + 1,
+        next_attempt_at=now + timedelta(seconds=lease_seconds),
+    )
+    if not claimed:
+        return []
+    return list(PushOutbox.objects.filter(lease_id=lease_id).order_by('id'))
+
+
+def deliver_pushes(dispatcher, rows):
+    """Send claimed outbox rows and record the outcome. Returns (sent, retried, failed)."""
+    messages = [{'to': r.token, 'title': r.title, 'body': r.body, 'data': r.data} for r in rows]
+    tickets = dispatcher.send(messages)
+    now = timezone.now()
+    max_attempts = getattr(settings, 'PUSH_MAX_ATTEMPTS', 6)
+    sent, retried, failed, dead_tokens = [], [], [], set()
+    for row, ticket in zip(rows, tickets):
+        if ticket['status'] == 'ok':
+            row.status, row.sent_at, row.last_error = PushOutbox.SENT, now, ''
+            sent.append(row)
+            continue
+        row.last_error = (ticket['error'] or ticket['message'] or 'error')[:255]
+        if ticket['error'] in INVALID_TOKEN_ERRORS:
+            dead_tokens.add(row.token)
+        if ticket['error'] in PERMANENT_ERRORS or row.attempts >= max_attempts:
+            row.status = PushOutbox.FAILED
+            failed.append(row)
+        else:
+            row.next_attempt_at = now + retry_delay(row.attempts)
+            retried.append(row)
+    with transaction.atomic():
+        PushOutbox.objects.bulk_update(rows, ['status', 'sent_at', 'last_error', 'next_attempt_at'])
+        if dead_tokens:
+            DisciplineProfile.objects.filter(push_token__in=dead_tokens).update(push_token=None, version=F('version') + 1)
+            # Drop queued messages for the same dead tokens instead of paying for them later
+            PushOutbox.objects.filter(token__in=dead_tokens, status=PushOutbox.PENDING).update(
+                status=PushOutbox.FAILED, last_error='DeviceNotRegistered'
+            )
+    return len(sent), len(retried), len(failed)
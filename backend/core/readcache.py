@@ -0,0 +1,65 @@
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+
+HITS_KEY = 'readcache:hits'
+MISSES_KEY = 'readcache:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'READ_CACHE_ALIAS', 'default')]
+
+
+def generation_key(profile_id):
+    return f'readcache:gen:{profile_id}'
+
+
+def invalidate(profile_id):
+    # A fresh generation orphans every payload cached for the profile; they age out by TTL
+    get_cache().set(generation_key(profile_id), uuid.uuid4().hex, None)
+
+
+def payload_key(profile_id, generation, version, variant):
+    return f'readcache:{profile_id}:{generation}:{version}:{variant}'
+
+
+def count(key):
+    cache = get_cache()
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:  # evicted between add and incr
+        cache.set(key, 1, None)
+
+
+def lookup(profile_id, version, variant):
+    """Return ``(key, payload)`` for a read of ``variant`` at the profile's ``version``;
+    ``payload`` is None on a miss, and ``key`` is where ``store`` should put the rebuilt one.
+
+    Entries are also scoped to the profile's generation, which the model signals replace on
+    every write, so a recycled (profile id, version) pair never serves stale data.
+    """
+    cache = get_cache()
+    generation = cache.get(generation_key(profile_id))
+    if generation is None:
+        invalidate(profile_id)
+        generation = cache.get(generation_key(profile_id))
+    key = payload_key(profile_id, generation, version, variant)
+    payload = cache.get(key)
+    count(MISSES_KEY if payload is None else HITS_KEY)
+    return key, payload
+
+
+def store(key, payload):
+    get_cache().set(key, payload, getattr(settings, 'READ_CACHE_TIMEOUT', 300))
+
+
+def stats():
+    values = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = values.get(HITS_KEY, 0), values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
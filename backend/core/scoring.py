@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+from .achievements import evaluate_achievements
+from .models import AdaptiveTask, DisciplineProfile
+from .versioning import bump_profile
+
+STAT_MIN, STAT_MAX = 0, 100
+MICRO_SCORE = 5
+FULL_HEALTH_BONUS = 5
+
+
+def completion_delta(task, full):
+    """(score, health) credited for finishing ``task``."""
+    if full:
+        # Full Task = More XP
+        return task.difficulty_weight * 10, FULL_HEALTH_BONUS
+    # Micro Task = Streak Saved, but less growth
+    return MICRO_SCORE, 0
+
+
+def clamped(field, delta):
+    return Least(Greatest(F(field) + delta, Value(STAT_MIN)), Value(STAT_MAX))
+
+
+def apply_delta(profile, score_delta, health_delta):
+    """Apply a score/health delta with one UPDATE computed in the database, then evaluate
+    achievements against the fresh values."""
+    updates = {}
+    if score_delta:
+        updates['discipline_score'] = clamped('discipline_score', score_delta)
+    if health_delta:
+        updates['avatar_health'] = clamped('avatar_health', health_delta)
+    if not updates:
+        bump_profile(profile.pk)  # the task rows changed even if the stats did not
+        return
+    updates['version'] = F('version') + 1
+    before = {field: getattr(profile, field) for field in updates if field != 'version'}
+    DisciplineProfile.objects.filter(pk=profile.pk).update(**updates)
+    profile.refresh_from_db(fields=list(updates))
+    changed = {field for field, old in before.items() if getattr(profile, field) != old}
+    if changed:
+        evaluate_achievements(profile, changed)
+
+
+def complete_task(task, full):
+    """Credit ``task`` exactly once.
+
+    The conditional UPDATE claims the not-completed -> completed transition; of several
+    concurrent requests for the same task only one matches a row, and only that one
+    touches the profile. Returns whether this call won the transition.
+    """
+    flag = 'is_completed' if full else 'is_micro_completed'
+    with transaction.atomic():
+        claimed = AdaptiveTask.objects.filter(
+            pk=task.pk, is_completed=False, is_micro_completed=False
+        ).update(**{flag: True, 'updated_at': timezone.now()})
+        if claimed:
+            apply_delta(task.profile, *completion_delta(task, full))
+    return bool(claimed)
+
+
+def complete_tasks(queryset, completions):
+    """Apply many completions in one transaction.
+
+    ``completions`` maps task id -> True for a full completion or False for a micro one.
+    Pending tasks are locked, flagged with a single bulk_update, and the combined delta is
+    applied to the profile once. Returns (completed ids, skipped ids, profile with the new
+    stats), the profile being None if no task was completed.
+    """
+    with transaction.atomic():
+        tasks = list(
+            queryset.select_for_update().select_related('profile')
+            .filter(pk__in=completions, is_completed=False, is_micro_completed=False)
+        )
+        score_delta = health_delta = 0
+        now = timezone.now()
+        for task in tasks:
+            full = completions[task.pk]
+            task.is_completed, task.is_micro_completed = full, not full
+            task.updated_at = now
+            score, health = completion_delta(task, full)
+            score_delta += score
+            health_delta += health
+        if tasks:
+            AdaptiveTask.objects.bulk_update(tasks, ['is_completed', 'is_micro_completed', 'updated_at'])
+            apply_delta(tasks[0].profile, score_delta, health_delta)
+    completed = [task.pk for task in tasks]
+    profile = tasks[0].profile if tasks else None
+    return completed, [pk for pk in completions if pk not in set(completed)], profile
@@ -1,32 +1,88 @@
 from rest_framework import serializers
+from django.db import transaction
 from django.contrib.auth.models import User
 from .models import DisciplineProfile, AdaptiveTask, Achievement, Milestone
 
 class MilestoneSerializer(serializers.ModelSerializer):
     class Meta:
         model = Milestone
-        fields = '__all__'
+        exclude = ('deleted_at',)
+
+class NestedMilestoneSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Milestone
+        exclude = ('deleted_at',)
+        read_only_fields = ('task', 'updated_at')
 
 class TaskSerializer(serializers.ModelSerializer):
-    milestones = MilestoneSerializer(many=True, read_only=True)
+    milestones = NestedMilestoneSerializer(many=True, required=False)
+
+    def __init__(self, *args, **kwargs):
+        # Optional projection: TaskSerializer(..., fields=['id', 'title']) drops every other field
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
     class Meta:
         model = AdaptiveTask
-        fields = '__all__' # This gives FlutterFlow access to all fields
+        exclude = ('deleted_at',) # Everything else gives FlutterFlow access to all fields
+        read_only_fields = ('profile', 'required_level', 'updated_at')
+
+    def create(self, validated_data):
+        milestones_data = validated_data.pop('milestones', [])
+        with transaction.atomic():
+            task = AdaptiveTask.objects.create(**validated_data)
+            milestones = Milestone.objects.bulk_create([Milestone(task=task, **m) for m in milestones_data])
+        # Serve the response from what was just written instead of querying it back
+        task._prefetched_objects_cache = {'milestones': milestones}
+        return task
+
+    def update(self, instance, validated_data):
+        # Milestones are only written on create
+        validated_data.pop('milestones', None)
+        return super().update(instance, validated_data)
+
+class TaskCompletionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    is_completed = serializers.BooleanField(default=False)
+    is_micro_completed = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if not (data['is_completed'] or data['is_micro_completed']):
+            raise serializers.ValidationError('Set is_completed or is_micro_completed.')
+        return data
+
+class BatchCompletionSerializer(serializers.Serializer):
+    tasks = TaskCompletionSerializer(many=True, allow_empty=False, max_length=500)
 
 class AchievementSerializer(serializers.ModelSerializer):
     class Meta:
         model = Achievement
-        fields = '__all__'
+        exclude = ('deleted_at',)
 
 class ProfileSerializer(serializers.ModelSerializer):
+    INCLUDABLE = ('tasks', 'achievements')
+
     tasks = TaskSerializer(many=True, read_only=True)
     achievements = AchievementSerializer(many=True, read_only=True)
     level = serializers.ReadOnlyField()
+    tasks_count = serializers.IntegerField(read_only=True)
+    completed_tasks_count = serializers.IntegerField(read_only=True)
+    achievements_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = DisciplineProfile
-        fields = '__all__'
+        exclude = ('last_enforced_on', 'unlocked_achievements', 'version')
+
+    def __init__(self, *args, **kwargs):
+        # Nested collections are opt-in: ProfileSerializer(profile, include=['achievements'])
+        include = kwargs.pop('include', self.INCLUDABLE)
+        super().__init__(*args, **kwargs)
+        for name in self.INCLUDABLE:
+            if name not in include:
+                self.fields.pop(name)
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import invalidate_token
+from .models import AdaptiveTask, Milestone, Achievement, DisciplineProfile
+from . import readcache
+from .versioning import bump_profile
+
+
+@receiver(post_save, sender=DisciplineProfile)
+def profile_saved(sender, instance, **kwargs):
+    bump_profile(instance.pk)
+    readcache.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=DisciplineProfile)
+def profile_deleted(sender, instance, **kwargs):
+    readcache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=AdaptiveTask)
+@receiver(post_delete, sender=AdaptiveTask)
+@receiver(post_save, sender=Achievement)
+@receiver(post_delete, sender=Achievement)
+def profile_child_changed(sender, instance, **kwargs):
+    bump_profile(instance.profile_id)
+    readcache.invalidate(instance.profile_id)
+
+
+@receiver(post_save, sender=Milestone)
+@receiver(post_delete, sender=Milestone)
+def milestone_changed(sender, instance, **kwargs):
+    profile_id = AdaptiveTask.all_objects.filter(pk=instance.task_id).values_list('profile_id', flat=True).first()
+    bump_profile(profile_id)
+    readcache.invalidate(profile_id)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Cached tokens carry a copy of the user row
+    for key in Token.objects.filter(user_id=instance.pk).values_list('key', flat=True):
+        invalidate_token(key)
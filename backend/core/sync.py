@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .models import AdaptiveTask, Milestone, Achievement
+from .serializers import TaskSerializer, NestedMilestoneSerializer, AchievementSerializer
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+TASK_FIELDS = [f.name for f in AdaptiveTask._meta.concrete_fields if f.name != 'deleted_at']
+
+
+def encode_token(moment):
+    return str((moment - EPOCH) // timedelta(microseconds=1))
+
+
+def decode_token(token):
+    try:
+        return EPOCH + timedelta(microseconds=int(token))
+    except (TypeError, ValueError, OverflowError):
+        raise ValidationError({'since': 'Invalid sync token.'})
+
+
+def collect_changes(profile, since=None):
+    """Rows of the profile changed after ``since`` (all live rows when None), plus tombstones.
+
+    The next token is taken before querying and moved back by SYNC_TOKEN_OVERLAP so rows
+    committed by transactions that were still open at that moment are not missed; clients
+    may see a row twice and should upsert by id.
+    """
+    overlap = timedelta(seconds=getattr(settings, 'SYNC_TOKEN_OVERLAP_SECONDS', 5))
+    next_token = encode_token(timezone.now() - overlap)
+    sources = {
+        # Milestones are synced as their own collection rather than nested in each task
+        'tasks': (AdaptiveTask.all_objects.filter(profile=profile), TaskSerializer, {'fields': TASK_FIELDS}),
+        'milestones': (Milestone.all_objects.filter(task__profile=profile), NestedMilestoneSerializer, {}),
+        'achievements': (Achievement.all_objects.filter(profile=profile), AchievementSerializer, {}),
+    }
+    changes = {'token': next_token, 'full': since is None, 'deleted': {}}
+    for name, (queryset, serializer_class, kwargs) in sources.items():
+        if since is None:
+            live, deleted = queryset.filter(deleted_at__isnull=True), []
+        else:
+            changed = list(queryset.filter(updated_at__gt=since).order_by('updated_at', 'id'))
+            live = [row for row in changed if row.deleted_at is None]
+            deleted = [row.pk for row in changed if row.deleted_at is not None]
+        changes[name] = serializer_class(live, many=True, **kwargs).data
+        changes['deleted'][name] = deleted
+    return changes
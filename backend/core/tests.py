@@ -1,8 +1,32 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from io import StringIO
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.db.models import F, QuerySet, Value
+from django.db.models.functions import Lower
+from rest_framework.authtoken.models import Token
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
 from django.contrib.auth.models import User
-from rest_framework.test import APITestCase
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
-from .models import DisciplineProfile, AdaptiveTask
+from . import coachcache, llm, memory, metrics, readcache
+from .logconfig import JsonFormatter, QueueingHandler, SamplingFilter, redact
+from .achievements import evaluate_achievements
+from .models import DisciplineProfile, AdaptiveTask, Achievement, CoachMemory, EnforcementRun, Milestone, PushOutbox
+from .enforcement import enforceable_profiles, queue_penalty_notifications, run_due_timezones
+from .push import PushDispatcher, claim_pushes, enqueue_pushes
+from .authentication import get_cache, token_cache_key
 
 class ScoringLogicTestCase(APITestCase):
     def setUp(self):
@@ -81,3 +105,1140 @@ class OnboardingUnlockingTestCase(APITestCase):
         self.assertIn(self.task1.id, task_ids)
         self.assertIn(self.task2.id, task_ids)
         self.assertIn(self.task3.id, task_ids)
+
+    def test_locked_task_detail_is_hidden(self):
+        response = self.client.get('/api/tasks/%d/' % self.task2.id)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.patch('/api/tasks/%d/' % self.task3.id, {'is_completed': True})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_required_level_tracks_micro_version(self):
+        self.assertEqual([t.required_level for t in (self.task1, self.task2, self.task3)], [1, 2, 3])
+        self.task1.micro_version = 'v1.4'
+        self.task1.save(update_fields=['micro_version'])
+        self.assertEqual(AdaptiveTask.objects.get(pk=self.task1.pk).required_level, 5)
+        response = self.client.get('/api/tasks/')
+        self.assertEqual(response.data, [])
+
+class EnforcerTestCase(TestCase):
+    def setUp(self):
+        self.profiles = []
+        for i, (health, sick, done) in enumerate([(100, False, False), (10, False, False), (80, True, False), (90, False, True)]):
+            user = User.objects.create_user(username='enforce%d' % i, email='enforce%d@example.com' % i, password='password')
+            profile = DisciplineProfile.objects.create(user=user, avatar_health=health, current_streak=5, is_in_sickness_mode=sick)
+            AdaptiveTask.objects.create(profile=profile, title='Task', micro_version='v1.0', is_completed=done)
+            self.profiles.append(profile)
+
+    def test_bulk_penalty_in_chunks(self):
+        out = StringIO()
+        call_command('enforcer', '--chunk-size', '1', stdout=out)
+        self.assertIn('penalized 2 profiles', out.getvalue())
+        for profile in self.profiles:
+            profile.refresh_from_db()
+        self.assertEqual([p.avatar_health for p in self.profiles], [80, 0, 80, 90])
+        self.assertEqual([p.current_streak for p in self.profiles], [0, 0, 5, 5])
+
+    def test_penalty_pushes_are_queued(self):
+        DisciplineProfile.objects.filter(id=self.profiles[0].id).update(push_token='ExponentPushToken[a]')
+        call_command('enforcer', stdout=StringIO())
+        queued = PushOutbox.objects.get()
+        self.assertEqual((queued.profile_id, queued.token, queued.status), (self.profiles[0].id, 'ExponentPushToken[a]', PushOutbox.PENDING))
+        self.assertIn('80%', queued.body)
+
+    def test_shards_partition_profiles(self):
+        for shard in range(3):
+            call_command('enforcer', '--shard', '%d/3' % shard, stdout=StringIO())
+        for profile in self.profiles:
+            profile.refresh_from_db()
+        # Every profile is covered by exactly one shard, so nobody is penalized twice
+        self.assertEqual([p.avatar_health for p in self.profiles], [80, 0, 80, 90])
+
+    def test_invalid_shard(self):
+        with self.assertRaises(CommandError):
+            call_command('enforcer', '--shard', '3/3', stdout=StringIO())
+
+    def test_crashed_run_resumes_without_double_penalty(self):
+        for profile in self.profiles:
+            DisciplineProfile.objects.filter(pk=profile.pk).update(push_token='token%d' % profile.pk)
+        calls = []
+
+        def crash_on_second_chunk(notify):
+            calls.append(notify)
+            if len(calls) == 2:
+                raise RuntimeError('boom')
+            queue_penalty_notifications(notify)
+
+        with mock.patch('core.enforcement.queue_penalty_notifications', crash_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                call_command('enforcer', '--chunk-size', '1', '--date', '2026-03-02', stdout=StringIO())
+        run = EnforcementRun.objects.get(run_date=date(2026, 3, 2))
+        self.assertEqual((run.penalized, run.last_profile_id, run.finished_at), (1, self.profiles[0].pk, None))
+
+        out = StringIO()
+        call_command('enforcer', '--chunk-size', '1', '--date', '2026-03-02', stdout=out)
+        self.assertIn('Resumed 1', out.getvalue())
+        for profile in self.profiles:
+            profile.refresh_from_db()
+        self.assertEqual([p.avatar_health for p in self.profiles], [80, 0, 80, 90])
+        self.assertEqual(PushOutbox.objects.count(), 2)
+        out = StringIO()
+        call_command('enforcer', '--chunk-size', '1', '--date', '2026-03-02', stdout=out)
+        self.assertIn('Skipped 1 run(s) already finished', out.getvalue())
+        self.assertNotIn('Resumed', out.getvalue())
+        self.assertIn('penalized 0 profiles in 0 chunks', out.getvalue())
+        # A finished run is not repeated, even with a different shard layout
+        call_command('enforcer', '--date', '2026-03-02', '--shard', '0/2', stdout=StringIO())
+        call_command('enforcer', '--date', '2026-03-02', '--shard', '1/2', stdout=StringIO())
+        self.assertEqual(DisciplineProfile.objects.get(pk=self.profiles[0].pk).avatar_health, 80)
+
+    def test_sub_shards_cover_parent_shard(self):
+        parent = set(enforceable_profiles(1, 2).values_list('pk', flat=True))
+        children = set()
+        for w in range(3):
+            children |= set(enforceable_profiles(1 + w * 2, 6).values_list('pk', flat=True))
+        self.assertEqual(parent, children)
+
+class StubExpoHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        batch = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.batches.append(batch)
+        data = [
+            {'status': 'error', 'message': 'not registered', 'details': {'error': 'DeviceNotRegistered'}}
+            if m['to'].startswith('dead') else {'status': 'ok', 'id': m['to']}
+            for m in batch
+        ]
+        body = json.dumps({'data': data}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubExpoServerMixin:
+    def start_push_server(self):
+        self.push_server = HTTPServer(('127.0.0.1', 0), StubExpoHandler)
+        self.push_server.batches = []
+        threading.Thread(target=self.push_server.serve_forever, daemon=True).start()
+        self.addCleanup(self.push_server.server_close)
+        self.addCleanup(self.push_server.shutdown)
+        return 'http://127.0.0.1:%d/push/send' % self.push_server.server_port
+
+
+class PushDispatcherTestCase(StubExpoServerMixin, TestCase):
+    def test_batches_and_ticket_errors(self):
+        endpoint = self.start_push_server()
+        messages = [{'to': 'token%d' % i, 'title': 't', 'body': 'b'} for i in range(250)]
+        messages[120]['to'] = 'dead-token'
+        with PushDispatcher(endpoint=endpoint, concurrency=3) as dispatcher:
+            tickets = dispatcher.send(messages)
+        self.assertEqual(sorted(len(b) for b in self.push_server.batches), [50, 100, 100])
+        self.assertEqual([t['to'] for t in tickets], [m['to'] for m in messages])
+        failed = [t for t in tickets if t['status'] != 'ok']
+        self.assertEqual(failed, [{'to': 'dead-token', 'status': 'error', 'error': 'DeviceNotRegistered', 'message': 'not registered'}])
+
+
+class PushWorkerTestCase(StubExpoServerMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pusher', email='pusher@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user, push_token='dead-token')
+        enqueue_pushes([
+            {'profile_id': self.profile.id, 'to': 'dead-token', 'title': 't', 'body': 'b'},
+            {'to': 'live-token', 'title': 't', 'body': 'b'},
+        ])
+
+    def test_delivers_and_clears_invalid_tokens(self):
+        with override_settings(EXPO_PUSH_URL=self.start_push_server()):
+            call_command('push_worker', '--once', stdout=StringIO())
+        statuses = dict(PushOutbox.objects.values_list('token', 'status'))
+        self.assertEqual(statuses, {'dead-token': PushOutbox.FAILED, 'live-token': PushOutbox.SENT})
+        self.profile.refresh_from_db()
+        self.assertIsNone(self.profile.push_token)
+
+    def test_transport_failure_is_retried_with_backoff(self):
+        with override_settings(EXPO_PUSH_URL='http://127.0.0.1:9/unreachable', PUSH_TIMEOUT=1):
+            call_command('push_worker', '--once', stdout=StringIO())
+        for row in PushOutbox.objects.all():
+            self.assertEqual((row.status, row.attempts, row.last_error), (PushOutbox.PENDING, 1, 'RequestFailed'))
+            self.assertGreater(row.next_attempt_at, timezone.now())
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.push_token, 'dead-token')
+
+    def test_rows_are_claimed_once(self):
+        stale_ids = list(PushOutbox.objects.values_list('id', flat=True))
+        first = claim_pushes(10)
+        self.assertEqual([row.attempts for row in first], [1, 1])
+        # A second worker that read the same due ids before the first claim gets nothing
+        with mock.patch.object(QuerySet, 'values_list', return_value=stale_ids):
+            self.assertEqual(claim_pushes(10), [])
+        self.assertEqual(set(PushOutbox.objects.values_list('attempts', flat=True)), {1})
+
+
+class TimezoneEnforcementTestCase(APITestCase):
+    def setUp(self):
+        self.profiles = {}
+        for name in ['UTC', 'Asia/Tokyo']:
+            user = User.objects.create_user(username=name, email='%s@example.com' % name.replace('/', '.'), password='password')
+            profile = DisciplineProfile.objects.create(user=user, timezone=name)
+            AdaptiveTask.objects.create(profile=profile, title='Task', micro_version='v1.0')
+            self.profiles[name] = profile
+
+    def health(self):
+        return {name: DisciplineProfile.objects.get(pk=p.pk).avatar_health for name, p in self.profiles.items()}
+
+    def test_only_buckets_past_local_midnight_are_enforced_once(self):
+        utc_midnight = datetime(2026, 3, 2, 0, 10, tzinfo=dt_timezone.utc)
+        self.assertEqual(run_due_timezones(now=utc_midnight)['penalized'], 1)
+        # Overlapping bucket runs are idempotent
+        self.assertEqual(run_due_timezones(now=utc_midnight + timedelta(minutes=15))['penalized'], 0)
+        self.assertEqual(self.health(), {'UTC': 80, 'Asia/Tokyo': 100})
+        # 15:10 UTC is 00:10 in Tokyo
+        self.assertEqual(run_due_timezones(now=utc_midnight + timedelta(hours=15))['penalized'], 1)
+        self.assertEqual(self.health(), {'UTC': 80, 'Asia/Tokyo': 80})
+        # Nobody is due mid-afternoon UTC+0 / late night Tokyo
+        with self.assertNumQueries(1):
+            self.assertEqual(run_due_timezones(now=utc_midnight + timedelta(hours=6))['penalized'], 0)
+
+    def test_update_timezone(self):
+        self.client.force_authenticate(user=self.profiles['UTC'].user)
+        response = self.client.post('/api/update-timezone/', {'timezone': 'Europe/Berlin'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(DisciplineProfile.objects.get(pk=self.profiles['UTC'].pk).timezone, 'Europe/Berlin')
+        response = self.client.post('/api/update-timezone/', {'timezone': 'Mars/Olympus'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class HistoryPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='historian', email='historian@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user)
+        self.tasks = [AdaptiveTask.objects.create(profile=self.profile, title='Task %d' % i, micro_version='v1.0') for i in range(5)]
+        # Ties on created_at must still page deterministically by id
+        AdaptiveTask.objects.filter(pk__in=[t.pk for t in self.tasks[1:4]]).update(created_at=self.tasks[1].created_at)
+        self.client.force_authenticate(user=self.user)
+
+    def test_walks_history_with_cursor(self):
+        seen, url = [], '/api/history/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen += [t['id'] for t in response.data['results']]
+            url = response.data['next'] and '/api/history/?page_size=2&cursor=%s' % response.data['next']
+        expected = AdaptiveTask.objects.filter(profile=self.profile).order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_field_projection(self):
+        response = self.client.get('/api/history/?fields=id,title,bogus')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/history/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProfileSummaryTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='summary', email='summary@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user)
+        for i in range(3):
+            task = AdaptiveTask.objects.create(profile=self.profile, title='Task %d' % i, micro_version='v1.0', is_completed=i == 0)
+            Milestone.objects.create(task=task, title='Step')
+        self.client.force_authenticate(user=self.user)
+
+    def test_summary_has_counts_but_no_nested_collections(self):
+        response = self.client.get('/api/profile/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('tasks', response.data)
+        self.assertNotIn('achievements', response.data)
+        self.assertEqual((response.data['tasks_count'], response.data['completed_tasks_count']), (3, 1))
+
+    def test_include_uses_fixed_number_of_queries(self):
+        with self.assertNumQueries(5):  # version lookup, profile with counts, tasks, milestones, achievements
+            response = self.client.get('/api/profile/?include=tasks,achievements')
+        self.assertEqual(len(response.data['tasks']), 3)
+        self.assertEqual(len(response.data['tasks'][0]['milestones']), 1)
+        for i in range(5):
+            task = AdaptiveTask.objects.create(profile=self.profile, title='More %d' % i, micro_version='v1.0')
+            Milestone.objects.create(task=task, title='Step')
+        with self.assertNumQueries(5):
+            self.client.get('/api/profile/?include=tasks,achievements')
+
+
+class AchievementEngineTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='achiever', email='achiever@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user, discipline_score=75, avatar_health=95)
+        self.task = AdaptiveTask.objects.create(profile=self.profile, title='Task', micro_version='v1.0')
+        self.client.force_authenticate(user=self.user)
+
+    def test_profile_reads_do_not_unlock(self):
+        DisciplineProfile.objects.filter(pk=self.profile.pk).update(avatar_health=100)
+        self.client.get('/api/profile/')
+        self.assertFalse(Achievement.objects.exists())
+
+    def test_completion_unlocks_changed_stats_once(self):
+        self.client.patch('/api/tasks/%d/' % self.task.id, {'is_completed': True})
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.unlocked_achievements, ['Health Guardian', 'Task Completion Hero'])
+        self.assertEqual(Achievement.objects.filter(profile=self.profile).count(), 2)
+        # Known unlocks are skipped without touching the database
+        with self.assertNumQueries(0):
+            self.assertEqual(evaluate_achievements(self.profile), [])
+
+    def test_unchanged_stats_are_not_evaluated(self):
+        self.profile.current_streak = 7
+        self.assertEqual(evaluate_achievements(self.profile, {'avatar_health'}), [])
+        self.assertEqual(len(evaluate_achievements(self.profile, {'current_streak'})), 1)
+
+
+class ConcurrentCompletionTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='racer', email='racer@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user, discipline_score=50, avatar_health=90)
+        self.task = AdaptiveTask.objects.create(profile=self.profile, title='Race', micro_version='v1.0', difficulty_weight=2)
+
+    def test_concurrent_completions_credit_once(self):
+        barrier = threading.Barrier(4)
+        codes = []
+
+        def complete():
+            client = APIClient()
+            client.force_authenticate(user=self.user)
+            barrier.wait()
+            try:
+                codes.append(client.patch('/api/tasks/%d/' % self.task.id, {'is_completed': True}, format='json').status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=complete) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(codes, [status.HTTP_200_OK] * 4)
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.discipline_score, self.profile.avatar_health), (70, 95))
+
+
+class BatchCompletionTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='batcher', email='batcher@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user, discipline_score=10, avatar_health=50)
+        self.client.force_authenticate(user=self.user)
+
+    def make_tasks(self, count):
+        return [AdaptiveTask.objects.create(profile=self.profile, title='Task %d' % i, micro_version='v1.0') for i in range(count)]
+
+    def test_applies_combined_delta_once(self):
+        tasks = self.make_tasks(3)
+        AdaptiveTask.objects.filter(pk=tasks[2].pk).update(is_completed=True)
+        payload = {'tasks': [
+            {'id': tasks[0].id, 'is_completed': True},
+            {'id': tasks[1].id, 'is_micro_completed': True},
+            {'id': tasks[2].id, 'is_completed': True},
+        ]}
+        response = self.client.post('/api/tasks/complete/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['completed'], response.data['skipped']), ([tasks[0].id, tasks[1].id], [tasks[2].id]))
+        self.assertEqual((response.data['discipline_score'], response.data['avatar_health']), (25, 55))
+        self.assertEqual(
+            list(AdaptiveTask.objects.order_by('id').values_list('is_completed', 'is_micro_completed')),
+            [(True, False), (False, True), (True, False)],
+        )
+
+    def test_query_count_is_constant(self):
+        def complete_all(tasks):
+            payload = {'tasks': [{'id': t.id, 'is_micro_completed': True} for t in tasks]}
+            # A fresh user per request, as token authentication hands out: the profile is not loaded
+            self.client.force_authenticate(user=User.objects.get(pk=self.user.pk))
+            with self.assertNumQueries(7):
+                self.client.post('/api/tasks/complete/', payload, format='json')
+        complete_all(self.make_tasks(2))
+        complete_all(self.make_tasks(10))
+
+    def test_requires_a_completion_flag(self):
+        task = self.make_tasks(1)[0]
+        response = self.client.post('/api/tasks/complete/', {'tasks': [{'id': task.id}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TaskCreateImportTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', email='importer@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user)
+        # A freshly loaded user, as token authentication hands out: the profile is not loaded
+        self.client.force_authenticate(user=User.objects.get(pk=self.user.pk))
+
+    def test_nested_create(self):
+        payload = {'title': 'Run', 'micro_version': 'v1.0', 'milestones': [{'title': '1k'}, {'title': '5k', 'completed': True}]}
+        with self.assertNumQueries(6):  # profile, savepoint, task, version bump, milestones, release
+            response = self.client.post('/api/tasks/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([m['title'] for m in response.data['milestones']], ['1k', '5k'])
+        self.assertEqual(response.data['profile'], self.profile.id)
+        self.assertEqual(Milestone.objects.filter(task_id=response.data['id'], completed=True).count(), 1)
+
+    def upload(self, name, content):
+        return self.client.post('/api/tasks/import/', {'file': SimpleUploadedFile(name, content.encode())}, format='multipart')
+
+    def test_import_jsonl(self):
+        lines = [json.dumps({'title': 'Task %d' % i, 'micro_version': 'v1.%d' % (i % 2), 'milestones': [{'title': 'a'}, {'title': 'b'}]}) for i in range(6)]
+        response = self.upload('plan.jsonl', '\n'.join(lines) + '\n')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'imported': 6, 'milestones': 12})
+        self.assertEqual(AdaptiveTask.objects.filter(profile=self.profile, required_level=2).count(), 3)
+
+    def test_import_csv(self):
+        response = self.upload('plan.csv', 'title,micro_version,difficulty_weight,milestones\nRead,v1.0,2,ch1|ch2\nWalk,v1.1,,\n')
+        self.assertEqual(response.data, {'imported': 2, 'milestones': 2})
+        self.assertEqual(AdaptiveTask.objects.get(title='Read').difficulty_weight, 2)
+
+    def test_invalid_row_rolls_back(self):
+        response = self.upload('plan.jsonl', '{"title": "ok", "micro_version": "v1.0"}\n{"micro_version": "v1.0"}\n')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['line'], 2)
+        self.assertFalse(AdaptiveTask.objects.exists())
+
+
+@override_settings(SYNC_TOKEN_OVERLAP_SECONDS=0)
+class DeltaSyncTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='syncer', email='syncer@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user)
+        self.tasks = [AdaptiveTask.objects.create(profile=self.profile, title='Task %d' % i, micro_version='v1.0') for i in range(3)]
+        self.milestone = Milestone.objects.create(task=self.tasks[2], title='Step')
+        self.client.force_authenticate(user=self.user)
+
+    def test_full_then_delta_sync(self):
+        response = self.client.get('/api/sync/')
+        self.assertTrue(response.data['full'])
+        self.assertEqual(len(response.data['tasks']), 3)
+        self.assertEqual(len(response.data['milestones']), 1)
+        token = response.data['token']
+
+        response = self.client.get('/api/sync/?since=%s' % token)
+        self.assertEqual((response.data['tasks'], response.data['milestones']), ([], []))
+
+        self.client.patch('/api/tasks/%d/' % self.tasks[0].id, {'is_completed': True}, format='json')
+        self.client.delete('/api/tasks/%d/' % self.tasks[2].id)
+        response = self.client.get('/api/sync/?since=%s' % token)
+        self.assertEqual([t['id'] for t in response.data['tasks']], [self.tasks[0].id])
+        self.assertTrue(response.data['tasks'][0]['is_completed'])
+        self.assertEqual(response.data['deleted'], {'tasks': [self.tasks[2].id], 'milestones': [self.milestone.id], 'achievements': []})
+        self.assertEqual(response.data['profile']['tasks_count'], 2)
+        # Deleted tasks disappear from the regular endpoints
+        self.assertEqual(len(self.client.get('/api/tasks/').data), 2)
+
+    def test_invalid_token(self):
+        self.assertEqual(self.client.get('/api/sync/?since=yesterday').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_admin_deletes_leave_tombstones(self):
+        token = self.client.get('/api/sync/').data['token']
+        admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+        self.client.force_login(admin)
+        self.client.post('/admin/core/adaptivetask/%d/delete/' % self.tasks[2].id, {'post': 'yes'})
+        self.client.post('/admin/core/adaptivetask/', {'action': 'delete_selected', 'post': 'yes', '_selected_action': [self.tasks[0].id]})
+        self.assertEqual(AdaptiveTask.all_objects.filter(deleted_at__isnull=False).count(), 2)
+        response = self.client.get('/api/sync/?since=%s' % token)
+        self.assertEqual(sorted(response.data['deleted']['tasks']), [self.tasks[0].id, self.tasks[2].id])
+        self.assertEqual(response.data['deleted']['milestones'], [self.milestone.id])
+
+
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='etag', email='etag@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user)
+        self.task = AdaptiveTask.objects.create(profile=self.profile, title='Task', micro_version='v1.0')
+        self.milestone = Milestone.objects.create(task=self.task, title='Step')
+        self.client.force_authenticate(user=self.user)
+
+    def assertRevalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        return etag
+
+    def test_not_modified_until_a_write(self):
+        for url in ('/api/profile/', '/api/history/', '/api/tasks/', '/api/tasks/%d/' % self.task.id):
+            etag = self.assertRevalidates(url)
+            self.client.patch('/api/tasks/%d/' % self.task.id, {'title': 'Renamed %s' % url}, format='json')
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_query_string_and_set_based_writes_change_the_tag(self):
+        etag = self.assertRevalidates('/api/profile/')
+        self.assertNotEqual(self.client.get('/api/profile/?include=tasks')['ETag'], etag)
+        # Milestone saves, scoring UPDATEs and the enforcer all advance the version
+        self.milestone.save()
+        etag = self.assertRevalidates('/api/profile/')
+        self.client.patch('/api/tasks/%d/' % self.task.id, {'is_completed': True}, format='json')
+        self.assertEqual(self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        etag = self.assertRevalidates('/api/profile/')
+        AdaptiveTask.objects.create(profile=self.profile, title='Open', micro_version='v1.0')
+        etag = self.assertRevalidates('/api/profile/')
+        call_command('enforcer', stdout=StringIO())
+        self.assertEqual(self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_stale_instance_save_does_not_rewind_version(self):
+        stale = DisciplineProfile.objects.get(pk=self.profile.pk)
+        AdaptiveTask.objects.create(profile=self.profile, title='Another', micro_version='v1.0')
+        before = DisciplineProfile.objects.values_list('version', flat=True).get(pk=self.profile.pk)
+        stale.is_in_sickness_mode = True
+        stale.save()
+        self.assertEqual(DisciplineProfile.objects.values_list('version', flat=True).get(pk=self.profile.pk), before + 1)
+
+
+class ReadCacheTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cached', email='cached@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user)
+        self.task = AdaptiveTask.objects.create(profile=self.profile, title='Task', micro_version='v1.0')
+        self.client.force_authenticate(user=self.user)
+        readcache.reset_stats()
+
+    def assertServedFromCache(self, url):
+        first = self.client.get(url)
+        with self.assertNumQueries(1):  # the version lookup only
+            second = self.client.get(url)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+        return second
+
+    def test_hits_until_a_signal_invalidates(self):
+        for url in ('/api/profile/?include=tasks', '/api/history/', '/api/tasks/'):
+            self.assertServedFromCache(url)
+        self.assertEqual(readcache.stats(), {'hits': 3, 'misses': 3, 'hit_rate': 0.5})
+
+        Milestone.objects.create(task=self.task, title='Step')
+        response = self.client.get('/api/tasks/')
+        self.assertEqual(len(response.data[0]['milestones']), 1)
+        self.assertEqual(readcache.stats()['misses'], 4)
+
+    def test_set_based_writes_miss(self):
+        self.assertServedFromCache('/api/profile/')
+        DisciplineProfile.objects.filter(pk=self.profile.pk).update(discipline_score=90)  # no signal, no version bump
+        self.assertEqual(self.client.get('/api/profile/').data['discipline_score'], 50)
+        self.client.patch('/api/tasks/%d/' % self.task.id, {'is_completed': True}, format='json')
+        self.assertEqual(self.client.get('/api/profile/').data['discipline_score'], 100)
+
+    def test_stats_endpoint_is_admin_only(self):
+        self.assertEqual(self.client.get('/api/cache-stats/').status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get('/api/profile/')
+        self.assertEqual(self.client.get('/api/cache-stats/').data['misses'], 1)
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+        }):
+            readcache.invalidate(self.profile.pk)
+            self.assertServedFromCache('/api/history/')
+            self.assertEqual(readcache.stats()['hits'], 1)
+
+
+class CachedTokenAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tokened', email='tokened@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_cached_token_costs_no_queries(self):
+        response = self.client.get('/api/profile/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(1):  # the profile version lookup, by primary key
+            response = self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_cache_entry_holds_no_password_hash(self):
+        self.client.get('/api/tasks/')
+        values, profile_id = get_cache().get(token_cache_key(self.token.key))
+        self.assertEqual(profile_id, self.profile.pk)
+        self.assertNotIn(self.user.password, values)
+        self.assertEqual(values, [self.user.pk, 'tokened', 'tokened@example.com', True, False, False])
+
+    def test_user_instances_are_not_shared_between_requests(self):
+        self.client.get('/api/tasks/')  # an earlier request must not leave a stale profile behind
+        DisciplineProfile.objects.filter(pk=self.profile.pk).update(discipline_score=95, version=F('version') + 1)
+        task = AdaptiveTask.objects.create(profile=self.profile, title='Task', micro_version='v1.0')
+        response = self.client.post('/api/tasks/complete/', {'tasks': [{'id': task.id, 'is_completed': True}]}, format='json')
+        self.assertEqual(response.data['discipline_score'], 100)
+
+    def test_deleted_token_is_rejected(self):
+        self.assertEqual(self.client.get('/api/tasks/').status_code, status.HTTP_200_OK)
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/tasks/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get('/api/tasks/').status_code, status.HTTP_200_OK)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/tasks/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(READ_CACHE_TIMEOUT=0)
+class QueryBudgetTestCase(APITestCase):
+    """Pins the SQL statements per endpoint at two data sizes, so an N+1 fails the build.
+
+    Token authentication is warmed up first and costs nothing afterwards; the read cache is
+    disabled so every request runs its view.
+    """
+    BUDGETS = [
+        ('get', '/api/profile/', 2),
+        ('get', '/api/profile/?include=tasks,achievements', 5),
+        ('get', '/api/tasks/', 3),
+        ('get', '/api/history/', 4),
+        ('get', '/api/history/?fields=id,title', 3),
+        ('get', '/api/sync/', 4),
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='budget', email='budget@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.seed(3)
+        self.client.get('/api/tasks/')
+
+    def seed(self, count):
+        for i in range(count):
+            task = AdaptiveTask.objects.create(profile=self.profile, title='Task %d' % i, micro_version='v1.0')
+            Milestone.objects.bulk_create([Milestone(task=task, title='a'), Milestone(task=task, title='b')])
+        Achievement.objects.get_or_create(profile=self.profile, name='Seeded %d' % count, defaults={'description': ''})
+
+    def assertBudgets(self):
+        for method, url, budget in self.BUDGETS:
+            with self.subTest(url=url), self.assertNumQueries(budget):
+                response = getattr(self.client, method)(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_read_endpoints(self):
+        self.assertBudgets()
+        self.seed(20)
+        self.assertBudgets()
+
+    def test_task_detail_and_writes(self):
+        task = AdaptiveTask.objects.filter(profile=self.profile).first()
+        with self.assertNumQueries(3):
+            self.client.get('/api/tasks/%d/' % task.id)
+        with self.assertNumQueries(1):
+            self.client.post('/api/update-timezone/', {'timezone': 'Europe/Paris'}, format='json')
+        tasks = [{'id': t.id, 'is_completed': True} for t in AdaptiveTask.objects.filter(profile=self.profile)]
+        with self.assertNumQueries(9):  # includes unlocking an achievement and its version bump
+            self.client.post('/api/tasks/complete/', {'tasks': tasks}, format='json')
+
+    def test_auth_endpoints_use_the_email_index(self):
+        self.client.credentials()
+        with self.assertNumQueries(2):  # user by email, token
+            response = self.client.post('/api/login/', {'email': 'BUDGET@example.com', 'password': 'password'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        query = str(User.objects.alias(email_lower=Lower('email')).filter(email_lower=Lower(Value('x@example.com'))).query)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + query.replace('x@example.com', "'x@example.com'"))
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('auth_user_email_lower_idx', plan)
+
+
+class RequestMetricsTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='measured', email='measured@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def test_requests_are_recorded_per_view(self):
+        before = metrics.request_queries.count(view='history')
+        self.client.get('/api/history/')
+        self.client.get('/api/nowhere/')
+        self.assertEqual(metrics.request_queries.count(view='history'), before + 1)
+        self.assertGreater(metrics.request_queries.count(view='<unmatched>'), 0)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE sentinl_request_duration_seconds histogram', body)
+        self.assertIn('sentinl_request_db_queries_bucket{view="history",le="+Inf"}', body)
+        self.assertIn('sentinl_requests_total{method="GET",status="200",view="history"}', body)
+
+    async def test_sync_views_served_over_asgi_record_sql(self):
+        token = await Token.objects.acreate(user=self.user)
+        before = metrics.request_queries.count(view='history')
+        with override_settings(METRICS_SERVER_TIMING=True):
+            response = await AsyncClient().get('/api/history/', headers={'Authorization': 'Token ' + token.key})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(metrics.request_queries.count(view='history'), before + 1)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[0-9.]+;desc="[1-9][0-9]* queries", total;dur=[0-9.]+$')
+
+    def test_server_timing_is_opt_in(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/history/'))
+        with override_settings(METRICS_SERVER_TIMING=True):
+            self.client = APIClient()
+            self.client.force_authenticate(user=self.user)
+            response = self.client.get('/api/history/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[0-9.]+;desc="[1-9][0-9]* queries", total;dur=[0-9.]+$')
+
+    def test_enforcer_reports_sql_metrics(self):
+        AdaptiveTask.objects.create(profile=self.profile, title='Missed', micro_version='v1.0')
+        out = StringIO()
+        with tempfile.NamedTemporaryFile(mode='r', suffix='.prom') as f:
+            call_command('enforcer', '--metrics-file', f.name, stdout=out)
+            self.assertIn('sentinl_request_db_queries_count{view="command:enforcer"}', f.read())
+        self.assertRegex(out.getvalue(), r'SQL: [1-9][0-9]* queries in [0-9.]+s')
+
+
+class StructuredLoggingTestCase(TestCase):
+    def record(self, name='core.views', level=logging.DEBUG, msg='event', **extra):
+        return logging.makeLogRecord({'name': name, 'levelno': level, 'levelname': logging.getLevelName(level), 'msg': msg, **extra})
+
+    def test_secrets_are_redacted(self):
+        token = 'a' * 40
+        headers = {'Authorization': 'Token ' + token, 'Cookie': 'sessionid=1', 'Accept': 'application/json'}
+        self.assertEqual(redact(headers), {'Authorization': '[REDACTED]', 'Cookie': '[REDACTED]', 'Accept': 'application/json'})
+        line = JsonFormatter().format(self.record(msg='sent Bearer sk-abcdefghijkl for ' + token, headers=headers, user_id=3))
+        entry = json.loads(line)
+        self.assertNotIn(token, line)
+        self.assertEqual(entry['message'], 'sent Bearer [REDACTED] for [REDACTED]')
+        self.assertEqual((entry['user_id'], entry['headers']['Accept']), (3, 'application/json'))
+
+    def test_login_does_not_log_the_token(self):
+        User.objects.create_user(username='logger', email='logger@example.com', password='password')
+        with self.assertLogs('core.views', logging.INFO) as logs:
+            response = APIClient().post('/api/login/', {'email': 'logger@example.com', 'password': 'password'}, format='json')
+        for record in logs.records:
+            self.assertNotIn(response.data['token'], json.dumps(vars(record), default=str))
+
+    def test_sampling_only_thins_debug(self):
+        sampler = SamplingFilter({'core.views': 0, 'core': 1})
+        self.assertFalse(sampler.filter(self.record('core.views.detail')))
+        self.assertTrue(sampler.filter(self.record('core.views', logging.INFO)))
+        self.assertTrue(sampler.filter(self.record('core.scoring')))
+
+    def test_queue_handler_writes_in_the_background_and_never_blocks(self):
+        stream = StringIO()
+        handler = QueueingHandler(stream, maxsize=1)
+        try:
+            handler.handle(self.record(level=logging.INFO, msg='hello %s', args=('world',)))
+        finally:
+            handler.stop()
+        self.assertEqual(json.loads(stream.getvalue())['message'], 'hello world')
+        # With the listener stopped nothing drains the queue: the second record is dropped
+        handler.handle(self.record(level=logging.INFO))
+        handler.handle(self.record(level=logging.INFO))
+        self.assertEqual(handler.dropped, 1)
+        handler.close()
+
+
+class FakeModelHandler(BaseHTTPRequestHandler):
+    """Answers the OpenAI chat completion and transcription endpoints after ``server.delay``."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append(self.path)
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            self.answer(body)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def answer(self, body):
+        time.sleep(self.server.delay)
+        if self.path.endswith('/audio/transcriptions'):
+            return self.reply(b'I skipped my run again\n', 'text/plain')
+        request = json.loads(body)
+        messages = request['messages']
+        self.server.prompts.append(messages)
+        if request.get('stream'):
+            return self.stream(['', ' Coach:', ' %s' % messages[-1]['content'], ' '])
+        completion = {
+            'id': 'chatcmpl-1', 'object': 'chat.completion', 'created': 0, 'model': 'fake',
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': ' Coach: %s ' % messages[-1]['content']}}],
+        }
+        self.reply(json.dumps(completion).encode(), 'application/json')
+
+    def stream(self, deltas):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for delta in deltas:
+            chunk = {'id': 'chatcmpl-1', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'fake',
+                     'choices': [{'index': 0, 'delta': {'content': delta}, 'finish_reason': None}]}
+            self.wfile.write(b'data: %s\n\n' % json.dumps(chunk).encode())
+            self.wfile.flush()
+            time.sleep(self.server.token_delay)
+        self.wfile.write(b'data: [DONE]\n\n')
+
+    def reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeModelServerMixin:
+    def start_model_server(self, delay=0):
+        llm.manager.breaker.reset()
+        self.addCleanup(llm.manager.breaker.reset)
+        coachcache.replies.clear()
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeModelHandler)
+        server.delay, server.token_delay, server.requests, server.prompts = delay, 0, [], []
+        server.lock, server.in_flight, server.max_in_flight = threading.Lock(), 0, 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.model_server = server
+        return 'http://127.0.0.1:%d/v1' % server.server_port
+
+
+class AsyncCoachTestCase(FakeModelServerMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='coached', email='coached@example.com', password='password')
+        DisciplineProfile.objects.create(user=self.user)
+        self.auth = {'Authorization': 'Token ' + Token.objects.create(user=self.user).key}
+        settings = override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=self.start_model_server(delay=0.3))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    async def test_text_chat(self):
+        response = await self.async_client.post('/api/text-chat/', {'message': 'help me focus'},
+                                                content_type='application/json', headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'response': 'Coach: help me focus'})
+
+    async def test_voice_chat_transcribes_then_replies(self):
+        audio = SimpleUploadedFile('note.m4a', b'fake audio', content_type='audio/m4a')
+        response = await self.async_client.post('/api/voice-chat/', {'audio': audio}, headers=self.auth)
+        self.assertEqual(response.json(), {'transcript': 'I skipped my run again', 'response': 'Coach: I skipped my run again'})
+        self.assertEqual(self.model_server.requests, ['/v1/audio/transcriptions', '/v1/chat/completions'])
+
+    async def test_waiting_on_the_model_does_not_block_other_requests(self):
+        responses = await asyncio.gather(*[
+            self.async_client.post('/api/text-chat/', {'message': 'msg %d' % i}, content_type='application/json', headers=self.auth)
+            for i in range(4)
+        ])
+        self.assertEqual([r.json()['response'] for r in responses], ['Coach: msg %d' % i for i in range(4)])
+        # Serial calls would never overlap at the model, however fast or slow the machine is
+        self.assertGreater(self.model_server.max_in_flight, 1)
+
+    async def test_rejects_missing_token_and_empty_message(self):
+        response = await self.async_client.post('/api/text-chat/', {'message': 'hi'}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.post('/api/text-chat/', {'message': ' '}, content_type='application/json', headers=self.auth)
+        self.assertEqual(response.json(), {'error': 'No message provided'})
+        self.assertEqual(self.model_server.requests, [])
+
+
+class StreamingCoachTestCase(FakeModelServerMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='streamer', email='streamer@example.com', password='password')
+        self.auth = {'Authorization': 'Token ' + Token.objects.create(user=self.user).key}
+        settings = override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=self.start_model_server())
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.model_server.token_delay = 0.2
+
+    async def test_deltas_arrive_before_the_reply_is_complete(self):
+        started = time.monotonic()
+        response = await self.async_client.post('/api/text-chat/?stream=1', {'message': 'go'},
+                                                content_type='application/json', headers=self.auth)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events, first_event = [], None
+        async for chunk in response.streaming_content:
+            first_event = first_event or time.monotonic() - started
+            events.append(chunk.decode())
+        total = time.monotonic() - started
+        self.assertLess(first_event, total - 0.3)
+        self.assertEqual(events, [
+            'data: {"delta": "Coach:"}\n\n',
+            'data: {"delta": " go"}\n\n',
+            'data: {"delta": " "}\n\n',
+            'event: done\ndata: {"response": "Coach: go"}\n\n',
+        ])
+
+    async def test_upstream_failure_becomes_an_error_event(self):
+        with override_settings(OPENAI_BASE_URL='http://127.0.0.1:9/v1', LLM_MAX_RETRIES=0):
+            response = await self.async_client.post('/api/text-chat/', {'message': 'go'}, content_type='application/json',
+                                                    headers={**self.auth, 'Accept': 'text/event-stream'})
+            events = [chunk.decode() async for chunk in response.streaming_content]
+        self.assertEqual(len(events), 1)
+        self.assertTrue(events[0].startswith('event: error\n'))
+
+
+class LLMClientManagerTestCase(FakeModelServerMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='guarded', email='guarded@example.com', password='password')
+        self.auth = {'Authorization': 'Token ' + Token.objects.create(user=self.user).key}
+        settings = override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=self.start_model_server(), LLM_MAX_RETRIES=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def chat(self, message='hi'):
+        return self.async_client.post('/api/text-chat/', {'message': message}, content_type='application/json', headers=self.auth)
+
+    async def test_client_is_shared_between_requests(self):
+        await self.chat()
+        client = llm.manager.client()
+        await self.chat()
+        self.assertIs(llm.manager.client(), client)
+
+    async def test_breaker_opens_and_serves_the_fallback(self):
+        breaker = llm.manager.breaker
+        self.addCleanup(setattr, breaker, 'threshold', breaker.threshold)
+        self.addCleanup(setattr, breaker, 'cooldown', breaker.cooldown)
+        breaker.threshold, breaker.cooldown = 2, 60
+        before = llm.calls.value(outcome='short_circuited')
+        with override_settings(OPENAI_BASE_URL='http://127.0.0.1:9/v1'):
+            for _ in range(2):
+                self.assertEqual((await self.chat()).status_code, 500)
+        self.assertEqual(breaker.state, breaker.OPEN)
+        started = time.monotonic()
+        response = await self.chat()
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(response.json(), {'response': llm.fallback_message(), 'fallback': True})
+        self.assertEqual(self.model_server.requests, [])  # the healthy upstream was not called either
+        self.assertEqual(llm.calls.value(outcome='short_circuited'), before + 1)
+
+        breaker.opened_at -= 60  # cooldown elapsed: one trial call closes it again
+        self.assertEqual((await self.chat('back')).json(), {'response': 'Coach: back'})
+        self.assertEqual(breaker.state, breaker.CLOSED)
+
+    async def test_trial_call_always_resolves_the_breaker(self):
+        breaker = llm.manager.breaker
+        self.addCleanup(setattr, breaker, 'threshold', breaker.threshold)
+        self.addCleanup(setattr, breaker, 'cooldown', breaker.cooldown)
+        breaker.threshold, breaker.cooldown = 1, 0
+        breaker.record_failure()
+        with self.assertRaises(ValueError):  # not the upstream's fault
+            async with llm.session():
+                raise ValueError('bad request')
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        self.assertEqual((await self.chat('again')).json(), {'response': 'Coach: again'})
+
+        breaker.record_failure()
+        entered = asyncio.Event()
+
+        async def disconnected_stream():
+            async with llm.session():
+                entered.set()
+                await asyncio.sleep(10)
+
+        trial = asyncio.ensure_future(disconnected_stream())
+        await entered.wait()
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+        trial.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await trial
+        self.assertEqual(breaker.state, breaker.OPEN)  # with a fresh cooldown, ready for the next trial
+        self.assertEqual((await self.chat('later')).json(), {'response': 'Coach: later'})
+
+    async def test_voice_fallback_keeps_the_transcript(self):
+        audio = SimpleUploadedFile('note.m4a', b'fake audio', content_type='audio/m4a')
+        # The breaker opens between the transcription and the reply
+        with mock.patch.object(llm.manager.breaker, 'allow', side_effect=[True, False]):
+            response = await self.async_client.post('/api/voice-chat/', {'audio': audio}, headers=self.auth)
+        self.assertEqual(response.json(), {'transcript': 'I skipped my run again', 'response': llm.fallback_message(), 'fallback': True})
+
+    async def test_bulkhead_rejects_beyond_the_concurrency_limit(self):
+        self.model_server.delay = 0.5
+        before = llm.calls.value(outcome='rejected')
+        with override_settings(LLM_MAX_CONCURRENCY=1, LLM_QUEUE_TIMEOUT=0.1):
+            responses = await asyncio.gather(self.chat('first'), self.chat('second'))
+        self.assertEqual(sorted('fallback' in r.json() for r in responses), [False, True])
+        self.assertEqual(llm.calls.value(outcome='rejected'), before + 1)
+
+    async def test_bulkhead_serves_waiters_in_arrival_order(self):
+        bulkhead, order = llm.manager.bulkhead, []
+
+        async def wait(name):
+            if await bulkhead.acquire(1):
+                order.append(name)
+                bulkhead.release()
+
+        with override_settings(LLM_MAX_CONCURRENCY=1):
+            self.assertTrue(await bulkhead.acquire(1))
+            waiters = [asyncio.ensure_future(wait(name)) for name in ('first', 'second', 'third')]
+            await asyncio.sleep(0)
+            self.assertEqual(len(bulkhead.waiters), 3)
+            bulkhead.release()
+            await asyncio.gather(*waiters)
+        self.assertEqual(order, ['first', 'second', 'third'])
+        self.assertEqual((bulkhead.in_use, len(bulkhead.waiters)), (0, 0))
+
+    def test_loops_share_the_bulkhead_and_close_their_clients(self):
+        # Under WSGI every async view runs on an event loop of its own
+        clients, entered, leave = [], threading.Event(), threading.Event()
+
+        async def hold():
+            async with llm.session() as client:
+                clients.append(client)
+                entered.set()
+                await asyncio.to_thread(leave.wait)
+
+        async def call():
+            async with llm.session() as client:
+                clients.append(client)
+
+        with override_settings(LLM_MAX_CONCURRENCY=1, LLM_QUEUE_TIMEOUT=0.1):
+            holder = threading.Thread(target=async_to_sync(hold))
+            holder.start()
+            entered.wait()
+            with self.assertRaises(llm.LLMUnavailable):
+                async_to_sync(call)()
+            leave.set()
+            holder.join()
+        for _ in range(2):
+            async_to_sync(call)()
+        self.assertEqual(len({id(client) for client in clients}), 3)
+        self.assertTrue(all(client.is_closed() for client in clients))
+        self.assertEqual(llm.manager.bulkhead.in_use, 0)
+
+
+class CoachCacheTestCase(FakeModelServerMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='repeat', email='repeat@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user)
+        self.auth = {'Authorization': 'Token ' + Token.objects.create(user=self.user).key}
+        # Other users opening their first conversation; only first messages use the cache
+        self.others = [self.coached_user(f'newcomer{i}') for i in range(4)]
+        settings = override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=self.start_model_server(delay=0.2))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def coached_user(self, username):
+        user = User.objects.create_user(username=username, email=f'{username}@example.com', password='password')
+        DisciplineProfile.objects.create(user=user)
+        return {'Authorization': 'Token ' + Token.objects.create(user=user).key}
+
+    def chat(self, message, path='/api/text-chat/', headers=None):
+        return self.async_client.post(path, {'message': message}, content_type='application/json', headers=headers or self.auth)
+
+    def test_keys(self):
+        self.assertEqual(coachcache.normalize("  I CAN’T get   motivated!! "), 'i cant get motivated')
+        self.assertEqual(coachcache.token_set_key('How do I keep my streak?'), coachcache.token_set_key('keep streak how'))
+        self.assertNotEqual(coachcache.key_for('hi', 'prompt v1'), coachcache.key_for('hi', 'prompt v2'))
+
+    async def test_near_identical_prompts_hit(self):
+        before = coachcache.stats()
+        first = await self.chat("I can't get motivated")
+        started = time.monotonic()
+        second = await self.chat('i cant get MOTIVATED.', headers=self.others[0])
+        self.assertLess(time.monotonic() - started, 0.2)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(len(self.model_server.requests), 1)
+        after = coachcache.stats()
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (1, 1))
+        self.assertGreaterEqual(after['saved_seconds'] - before['saved_seconds'], 0.2)
+
+        with override_settings(COACH_CACHE_KEY_FUNCTION='core.coachcache.token_set_key'):
+            await self.chat('how do I keep my streak', headers=self.others[1])
+            await self.chat('Keep my streak: how?', headers=self.others[2])
+        self.assertEqual(len(self.model_server.requests), 2)
+
+    async def test_streamed_replies_are_cached(self):
+        for message, headers in (('stream me', self.auth), ('Stream me!', self.others[0])):
+            response = await self.chat(message, '/api/text-chat/?stream=1', headers)
+            events = [chunk.decode() async for chunk in response.streaming_content]
+        self.assertEqual(events[-1], 'event: done\ndata: {"response": "Coach: stream me"}\n\n')
+        self.assertEqual(len(self.model_server.requests), 1)
+
+    async def test_opted_out_users_bypass_the_cache(self):
+        response = await self.async_client.post('/api/coach-cache-opt-out/', {'opt_out': True},
+                                                content_type='application/json', headers=self.auth)
+        self.assertEqual(response.json(), {'coach_cache_opt_out': True})
+        await self.chat('private thought')
+        self.assertIn('discipline score 50/100', self.model_server.prompts[-1][0]['content'])
+        await self.chat('private thought', headers=self.others[0])
+        self.assertEqual(len(self.model_server.requests), 2)
+
+    async def test_later_messages_carry_context_and_bypass_the_cache(self):
+        await self.chat('hello')  # the first message: no context yet, so it is cached
+        await self.chat('hello')
+        self.assertEqual(len(self.model_server.requests), 2)
+        system, *history, _ = self.model_server.prompts[-1]
+        self.assertIn('discipline score 50/100', system['content'])
+        self.assertEqual(history[0], {'role': 'user', 'content': 'hello'})
+        await self.chat('What about tomorrow?')
+        await self.chat('What about tomorrow?', headers=self.others[0])  # never stored above
+        self.assertEqual(len(self.model_server.requests), 4)
+        await self.chat('hello', headers=self.others[1])
+        self.assertEqual(len(self.model_server.requests), 4)
+
+    async def test_a_returning_user_keeps_their_context(self):
+        await self.chat('I skipped my run')
+        await CoachMemory.objects.filter(profile=self.profile).aupdate(updated_at=timezone.now() - timedelta(days=2))
+        await self.chat('I skipped my run again')
+        system, *history, last = self.model_server.prompts[-1]
+        self.assertIn('streak 0 days', system['content'])
+        self.assertEqual(history[0], {'role': 'user', 'content': 'I skipped my run'})
+        self.assertEqual(last, {'role': 'user', 'content': 'I skipped my run again'})
+
+
+class CoachMemoryTestCase(FakeModelServerMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='chatty', email='chatty@example.com', password='password')
+        self.profile = DisciplineProfile.objects.create(user=self.user, discipline_score=73, current_streak=4)
+        AdaptiveTask.objects.create(profile=self.profile, title='Run', micro_version='v1.0')
+        AdaptiveTask.objects.create(profile=self.profile, title='Read', micro_version='v1.0', is_completed=True)
+        self.auth = {'Authorization': 'Token ' + Token.objects.create(user=self.user).key}
+        settings = override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=self.start_model_server(),
+                                     COACH_PROMPT_TOKEN_BUDGET=300, COACH_MEMORY_TURNS=4, COACH_SUMMARY_TOKENS=60)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def chat(self, message, path='/api/text-chat/'):
+        return self.async_client.post(path, {'message': message}, content_type='application/json', headers=self.auth)
+
+    def prompt_tokens(self, messages):
+        return sum(memory.estimate_tokens(m['content']) for m in messages)
+
+    async def test_prompt_includes_stats_and_recent_turns(self):
+        await self.chat('I skipped my run. What now?')
+        await self.chat('And tomorrow?')
+        system, *history, last = self.model_server.prompts[-1]
+        self.assertIn('level 8, discipline score 73/100, streak 4 days, avatar health 100%, 1 open tasks.', system['content'])
+        self.assertEqual(history, [
+            {'role': 'user', 'content': 'I skipped my run. What now?'},
+            {'role': 'assistant', 'content': 'Coach: I skipped my run. What now?'},
+        ])
+        self.assertEqual(last, {'role': 'user', 'content': 'And tomorrow?'})
+
+    async def test_prompt_stays_bounded_as_the_conversation_grows(self):
+        for i in range(30):
+            response = await self.chat(f'Day {i}: I finished my reading. ' + 'More detail here. ' * 10)
+            self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(self.prompt_tokens(prompt) <= 300 for prompt in self.model_server.prompts))
+        conversation = await CoachMemory.objects.aget(profile=self.profile)
+        self.assertEqual((conversation.exchanges, len(conversation.turns)), (30, 4))
+        self.assertLessEqual(memory.estimate_tokens(conversation.summary), 60)
+        self.assertIn('- User: Day 27: I finished my reading.', conversation.summary)  # the oldest lines were dropped
+        self.assertNotIn('Day 0:', conversation.summary)
+
+    def test_oversized_message_is_truncated_to_the_budget(self):
+        messages = memory.build_messages(None, None, 'x' * 10000, 'Be brief.', budget=100)
+        self.assertLessEqual(self.prompt_tokens(messages), 100)
+
+    async def test_streamed_replies_are_remembered_and_memory_can_be_cleared(self):
+        response = await self.chat('stream this', '/api/text-chat/?stream=1')
+        [chunk async for chunk in response.streaming_content]
+        conversation = await CoachMemory.objects.aget(profile=self.profile)
+        self.assertEqual(conversation.turns[-1], {'role': 'assistant', 'content': 'Coach: stream this'})
+        response = await self.async_client.delete('/api/coach-memory/', headers=self.auth)
+        self.assertEqual(response.status_code, 204)
+        await conversation.arefresh_from_db()
+        self.assertEqual((conversation.turns, conversation.summary), ([], ''))
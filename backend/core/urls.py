@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TaskViewSet, register, login, profile, history, register_push_token, toggle_sickness_mode, voice_chat, text_chat
+from .views import TaskViewSet, register, login, profile, history, sync, register_push_token, update_timezone, coach_cache_opt_out, clear_coach_memory, toggle_sickness_mode, voice_chat, text_chat, cache_stats
 
 router = DefaultRouter()
 router.register(r'tasks', TaskViewSet)
@@ -11,8 +11,13 @@ urlpatterns = [
     path('login/', login, name='login'),
     path('profile/', profile, name='profile'),
     path('history/', history, name='history'),
+    path('sync/', sync, name='sync'),
     path('register-push-token/', register_push_token, name='register_push_token'),
+    path('update-timezone/', update_timezone, name='update_timezone'),
+    path('coach-cache-opt-out/', coach_cache_opt_out, name='coach_cache_opt_out'),
+    path('coach-memory/', clear_coach_memory, name='clear_coach_memory'),
     path('toggle-sickness-mode/', toggle_sickness_mode, name='toggle_sickness_mode'),
+    path('cache-stats/', cache_stats, name='cache_stats'),
     path('voice-chat/', voice_chat, name='voice_chat'),
     path('text-chat/', text_chat, name='text_chat'),
 ]
\ No newline at end of file
@@ -1,26 +1,51 @@
-from rest_framework import viewsets, status
+import csv
+import json
+import logging
+import time
+from rest_framework import serializers, viewsets, status
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action, api_view, permission_classes, authentication_classes
+from rest_framework.parsers import FileUploadParser, MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
-from django.http import Http404
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from django.contrib.auth import authenticate
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Lower
 from django.contrib.auth.models import User
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.utils import timezone
 from rest_framework.authtoken.models import Token
-from .models import AdaptiveTask, DisciplineProfile, Achievement, Milestone
-from .serializers import TaskSerializer, RegisterSerializer, LoginSerializer, ProfileSerializer, MilestoneSerializer
-
-def check_achievements(profile):
-    print(f"Checking achievements for {profile.user.username}: health={profile.avatar_health}, score={profile.discipline_score}, streak={profile.current_streak}")
-    achievements = [
-        {'name': '7-Day Streak Master', 'description': 'Maintained a 7-day streak', 'condition': profile.current_streak >= 7},
-        {'name': 'Task Completion Hero', 'description': 'Achieved 80% discipline score', 'condition': profile.discipline_score >= 80},
-        {'name': 'Health Guardian', 'description': 'Maintained 100% avatar health', 'condition': profile.avatar_health >= 100},
-    ]
-    for ach in achievements:
-        if ach['condition'] and not Achievement.objects.filter(profile=profile, name=ach['name']).exists():
-            print(f"Creating achievement: {ach['name']}")
-            Achievement.objects.create(profile=profile, name=ach['name'], description=ach['description'])
+from . import coach, coachcache, llm, memory, metrics, readcache
+from .authentication import aauthenticate, profile_id_for
+from .importers import ImportRowError, import_tasks
+from .models import AdaptiveTask, DisciplineProfile, Achievement, CoachMemory
+from .pagination import KeysetPagination
+from .scoring import complete_task, complete_tasks
+from .serializers import TaskSerializer, BatchCompletionSerializer, RegisterSerializer, LoginSerializer, ProfileSerializer
+from .sync import collect_changes, decode_token
+from .versioning import conditional_on_profile_version
+
+logger = logging.getLogger(__name__)
+
+def users_with_email(email):
+    # Compares LOWER(email) so the auth_user_email_lower_idx expression index applies; iexact
+    # compiles to LIKE/UPPER() and scans the table
+    return User.objects.alias(email_lower=Lower('email')).filter(email_lower=Lower(Value(email)))
+
+def count_of(queryset):
+    # Correlated COUNT(*) per profile; avoids the row explosion of joining several reverse relations
+    counts = queryset.filter(profile=OuterRef('pk')).order_by().values('profile').annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+def profile_summaries():
+    return DisciplineProfile.objects.annotate(
+        tasks_count=count_of(AdaptiveTask.objects.all()),
+        completed_tasks_count=count_of(AdaptiveTask.objects.filter(is_completed=True)),
+        achievements_count=count_of(Achievement.objects.all()),
+    )
 
 class TaskViewSet(viewsets.ModelViewSet):
     queryset = AdaptiveTask.objects.all()
@@ -28,74 +53,92 @@ class TaskViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return self.request.user.disciplineprofile.tasks.all()
-
-    def create(self, request, *args, **kwargs):
-        # Set the profile to the current user's profile
-        request.data['profile'] = request.user.disciplineprofile.id
-
-        # Extract milestones from request data
-        milestones_data = request.data.pop('milestones', [])
-
-        # Create the task first
-        response = super().create(request, *args, **kwargs)
+        # Locked tasks are hidden from list and detail alike; filtered on the (profile, required_level) index.
+        # The level comes from the joined profile row: for integer levels, required_level <= score / 10 + 1
+        # is the same test as required_level <= DisciplineProfile.level on every backend
+        queryset = AdaptiveTask.objects.filter(
+            profile_id=profile_id_for(self.request.user),
+            required_level__lte=F('profile__discipline_score') / 10 + 1,
+        )
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.prefetch_related('milestones')
+        elif self.action in ('update', 'partial_update'):
+            queryset = queryset.select_related('profile')  # scored by complete_task
+        return queryset
 
-        if response.status_code == status.HTTP_201_CREATED:
-            task = AdaptiveTask.objects.get(id=response.data['id'])
-            # Create milestones for the task
-            for milestone_data in milestones_data:
-                Milestone.objects.create(
-                    task=task,
-                    title=milestone_data['title'],
-                    completed=milestone_data.get('completed', False)
-                )
+    @conditional_on_profile_version
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
-        return response
+    @conditional_on_profile_version
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
-    def list(self, request, *args, **kwargs):
-        profile = request.user.disciplineprofile
-        queryset = self.get_queryset()
-        filtered = [task for task in queryset if task.required_level <= profile.level]
-        serializer = self.get_serializer(filtered, many=True)
-        return Response(serializer.data)
+    def perform_create(self, serializer):
+        # Milestones are created with the task, see TaskSerializer.create
+        serializer.save(profile_id=profile_id_for(self.request.user))
 
-    def get_object(self):
-        obj = super().get_object()
-        profile = self.request.user.disciplineprofile
-        if obj.required_level > profile.level:
-            raise Http404
-        return obj
+    def perform_destroy(self, instance):
+        # Leave tombstones for /api/sync/ instead of deleting the rows
+        instance.soft_delete()
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
-        profile = instance.profile
-        
-        # Check if we are completing the task
-        was_already_completed = instance.is_completed or instance.is_micro_completed
-        is_completing = request.data.get('is_completed', False)
-        is_micro_completing = request.data.get('is_micro_completed', False)
-
-        if not was_already_completed:
-            if is_completing:
-                # Full Task = More XP
-                profile.discipline_score = min(100, profile.discipline_score + (instance.difficulty_weight * 10))
-                profile.avatar_health = min(100, profile.avatar_health + 5)
-            elif is_micro_completing:
-                # Micro Task = Streak Saved, but less growth
-                profile.discipline_score = min(100, profile.discipline_score + 5)
-            
-            profile.save()
-            check_achievements(profile)
+
+        # Check if we are completing the task; scoring happens in the database, see complete_task
+        flag = serializers.BooleanField()
+        try:
+            is_completing = flag.to_internal_value(request.data.get('is_completed', False))
+            is_micro_completing = flag.to_internal_value(request.data.get('is_micro_completed', False))
+        except serializers.ValidationError:
+            is_completing = is_micro_completing = False  # the serializer reports the bad value below
+
+        if is_completing or is_micro_completing:
+            complete_task(instance, full=is_completing)
 
         return super().update(request, *args, **kwargs)
 
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser, FileUploadParser])
+    def bulk_import(self, request):
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+        name = upload.name or ''
+        fmt = 'csv' if name.endswith('.csv') or upload.content_type == 'text/csv' else 'jsonl'
+        try:
+            tasks, milestones = import_tasks(profile_id_for(request.user), upload, fmt)
+        except ImportRowError as e:
+            return Response({'line': e.line, 'errors': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        except (UnicodeDecodeError, csv.Error) as e:
+            return Response({'error': f'Unreadable file: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'imported': tasks, 'milestones': milestones}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='complete')
+    def complete(self, request):
+        serializer = BatchCompletionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # A full completion wins if both flags are sent, as in update()
+        completions = {}
+        for item in serializer.validated_data['tasks']:
+            completions[item['id']] = completions.get(item['id'], False) or item['is_completed']
+        completed, skipped, profile = complete_tasks(self.get_queryset(), completions)
+        if profile is None:  # nothing to complete, so the profile was not loaded
+            profile = DisciplineProfile.objects.get(user_id=request.user.pk)
+        return Response({
+            'completed': completed,
+            'skipped': skipped,
+            'discipline_score': profile.discipline_score,
+            'avatar_health': profile.avatar_health,
+            'level': profile.level,
+        })
+
 @api_view(['POST'])
 @authentication_classes([])
 def register(request):
     serializer = RegisterSerializer(data=request.data)
     if serializer.is_valid():
         email = serializer.validated_data['email']
-        if User.objects.filter(email__iexact=email).exists():
+        if users_with_email(email).exists():
             return Response({'email': ['A user with this email already exists.']}, status=status.HTTP_400_BAD_REQUEST)
         user = serializer.save()
         # Create DisciplineProfile for the new user
@@ -109,41 +152,67 @@ def register(request):
 def login(request):
     serializer = LoginSerializer(data=request.data)
     if serializer.is_valid():
-        user = User.objects.filter(email__iexact=serializer.validated_data['email']).first()
+        user = users_with_email(serializer.validated_data['email']).first()
         if user and user.check_password(serializer.validated_data['password']):
             token, created = Token.objects.get_or_create(user=user)
-            print('Login token for', user.email, ':', token.key)
+            logger.info('login', extra={'user_id': user.id})
             return Response({'token': token.key, 'user': {'id': user.id, 'username': user.username, 'email': user.email}})
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_on_profile_version
 def profile(request):
-    print("Profile request headers:", request.headers)
-    print("User:", request.user)
-    print("Is authenticated:", request.user.is_authenticated)
+    logger.debug('profile request', extra={'user_id': request.user.pk, 'headers': request.headers})
     if not request.user.is_authenticated:
         return Response({'error': 'Not authenticated'}, status=status.HTTP_403_FORBIDDEN)
+    include = [name for name in request.query_params.get('include', '').split(',') if name in ProfileSerializer.INCLUDABLE]
+    queryset = profile_summaries()
+    if 'tasks' in include:
+        queryset = queryset.prefetch_related('tasks__milestones')
+    if 'achievements' in include:
+        queryset = queryset.prefetch_related('achievements')
     try:
-        profile = DisciplineProfile.objects.get(user=request.user)
-        check_achievements(profile)
-        serializer = ProfileSerializer(profile)
+        profile = queryset.get(user=request.user)
+        serializer = ProfileSerializer(profile, include=include)
         return Response(serializer.data)
     except DisciplineProfile.DoesNotExist:
         return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_on_profile_version
 def history(request):
     try:
         profile = DisciplineProfile.objects.get(user=request.user)
-        tasks = profile.tasks.all().order_by('-created_at')
-        serializer = TaskSerializer(tasks, many=True)
-        return Response(serializer.data)
+        tasks = profile.tasks.all()
+        fields = None
+        if request.query_params.get('fields'):
+            allowed = TaskSerializer().fields
+            fields = [f for f in request.query_params['fields'].split(',') if f in allowed] or ['id']
+            # created_at builds the next cursor; profile is read back by the related manager
+            tasks = tasks.only(*{'id', 'profile', 'created_at', *[f for f in fields if f != 'milestones']})
+        if fields is None or 'milestones' in fields:
+            tasks = tasks.prefetch_related('milestones')
+        page, next_cursor = KeysetPagination().paginate_queryset(tasks, request)
+        serializer = TaskSerializer(page, many=True, fields=fields)
+        return Response({'results': serializer.data, 'next': next_cursor})
     except DisciplineProfile.DoesNotExist:
         return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync(request):
+    try:
+        profile = profile_summaries().get(user=request.user)
+    except DisciplineProfile.DoesNotExist:
+        return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    since = request.query_params.get('since')
+    changes = collect_changes(profile, decode_token(since) if since else None)
+    changes['profile'] = ProfileSerializer(profile, include=[]).data
+    return Response(changes)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def register_push_token(request):
@@ -158,6 +227,37 @@ def register_push_token(request):
     except DisciplineProfile.DoesNotExist:
         return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def update_timezone(request):
+    name = request.data.get('timezone', '')
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        return Response({'error': 'Unknown timezone'}, status=status.HTTP_400_BAD_REQUEST)
+    updated = DisciplineProfile.objects.filter(user=request.user).update(timezone=name, version=F('version') + 1)
+    if not updated:
+        return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'timezone': name})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def coach_cache_opt_out(request):
+    try:
+        opt_out = serializers.BooleanField().to_internal_value(request.data.get('opt_out', True))
+    except serializers.ValidationError:
+        return Response({'error': 'opt_out must be a boolean'}, status=status.HTTP_400_BAD_REQUEST)
+    updated = DisciplineProfile.objects.filter(user=request.user).update(coach_cache_opt_out=opt_out, version=F('version') + 1)
+    if not updated:
+        return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'coach_cache_opt_out': opt_out})
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def clear_coach_memory(request):
+    CoachMemory.objects.filter(profile__user=request.user).update(summary='', turns=[], exchanges=0, updated_at=timezone.now())
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def toggle_sickness_mode(request):
@@ -169,71 +269,134 @@ def toggle_sickness_mode(request):
     except DisciplineProfile.DoesNotExist:
         return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def voice_chat(request):
-    from django.conf import settings
-    import openai
+def metrics_view(request):
+    # Plain Django view: Prometheus scrapers send no token and expect text, not DRF content negotiation
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    return Response({**readcache.stats(), 'coach': coachcache.stats()})
+
+# The coach views are plain async Django views: DRF views are sync-only and would hold a
+# worker thread for the whole model round trip. Served through sentinl_backend.asgi.
+
+def json_error(message, status_code):
+    return JsonResponse({'error': message}, status=status_code)
+
+def unauthenticated():
+    return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED,
+                        headers={'WWW-Authenticate': 'Token'})
+
+async def coach_context(user, message, system_prompt):
+    """Load the user's profile and coach memory and build the prompt for ``message``.
+
+    Returns (messages, memory, cache key); memory is None for users without a profile. Only
+    a first message, while the memory is still empty, is sent without the user's stats and
+    cached under the key for everyone; every later prompt carries the stats and memory and
+    bypasses the cache, as do all prompts of opted-out users.
+    """
+    profile, conversation = await memory.load(user)
+    if memory.is_empty(conversation) and not (profile and profile.coach_cache_opt_out):
+        return coach.chat_messages(message, system_prompt), conversation, coachcache.key_for(message, system_prompt)
+    return memory.build_messages(profile, conversation, message, system_prompt), conversation, None
+
+async def remember(conversation, message, reply):
+    if conversation is not None:
+        await memory.remember(conversation, message, reply)
+
+def request_payload(request):
+    if request.content_type == 'application/json':
+        return json.loads(request.body or b'{}')
+    return request.POST
+
+def wants_stream(request):
+    return request.GET.get('stream') == '1' or 'text/event-stream' in request.headers.get('Accept', '')
+
+def sse(data, event=None):
+    prefix = f'event: {event}\n' if event else ''
+    return f'{prefix}data: {json.dumps(data)}\n\n'
+
+async def stream_chat_events(user, message, messages, conversation, key):
+    """Relay model deltas as SSE ``data: {"delta": ...}`` events, then a ``done`` event
+    carrying the assembled reply (or an ``error`` event). Only a completed reply is
+    remembered."""
+    started = time.perf_counter()
+    first_token = None
+    parts = []
+    try:
+        async for delta in coach.stream_reply(messages, key):
+            if not parts:
+                delta = delta.lstrip()  # the JSON reply is stripped too
+                if not delta:
+                    continue
+                first_token = time.perf_counter() - started
+            parts.append(delta)
+            yield sse({'delta': delta})
+    except llm.LLMUnavailable:
+        yield sse({'response': llm.fallback_message(), 'fallback': True}, 'done')
+        return
+    except Exception as e:
+        yield sse({'error': str(e)}, 'error')
+        return
+    reply = ''.join(parts).strip()
+    logger.info('coach reply', extra={
+        'user_id': user.pk, 'streamed': True, 'chars': len(reply),
+        'ttft_ms': round((first_token or 0) * 1000), 'total_ms': round((time.perf_counter() - started) * 1000),
+    })
+    await remember(conversation, message, reply)
+    yield sse({'response': reply}, 'done')
+
+@csrf_exempt
+@require_POST
+async def voice_chat(request):
+    user = await aauthenticate(request)
+    if user is None:
+        return unauthenticated()
 
     audio_file = request.FILES.get('audio')
     if not audio_file:
-        return Response({'error': 'No audio file provided'}, status=status.HTTP_400_BAD_REQUEST)
+        return json_error('No audio file provided', status.HTTP_400_BAD_REQUEST)
 
+    text = ''
     try:
-        # Transcribe audio
-        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-            response_format="text"
-        )
-
-        text = transcript.strip()
+        text = await coach.transcribe(audio_file)
         if not text:
-            return Response({'error': 'Transcription failed'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Generate AI response
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an AI coach for a discipline app called SentinL. Help users with motivation, task completion, and habit building. Be encouraging and practical."},
-                {"role": "user", "content": text}
-            ],
-            max_tokens=150
-        )
-
-        ai_response = response.choices[0].message.content.strip()
-
-        return Response({'transcript': text, 'response': ai_response})
-
+            return json_error('Transcription failed', status.HTTP_400_BAD_REQUEST)
+        messages, conversation, key = await coach_context(user, text, coach.SYSTEM_PROMPT)
+        ai_response = await coach.reply(messages, key)
+        await remember(conversation, text, ai_response)
+        return JsonResponse({'transcript': text, 'response': ai_response})
+    except llm.LLMUnavailable:
+        return JsonResponse({'transcript': text, 'response': llm.fallback_message(), 'fallback': True})
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def text_chat(request):
-    from django.conf import settings
-    import openai
+        return json_error(str(e), status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    message = request.data.get('message', '').strip()
-    if not message:
-        return Response({'error': 'No message provided'}, status=status.HTTP_400_BAD_REQUEST)
+@csrf_exempt
+@require_POST
+async def text_chat(request):
+    user = await aauthenticate(request)
+    if user is None:
+        return unauthenticated()
 
     try:
-        # Generate AI response
-        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an AI coach for a discipline app called SentinL. Help users with motivation, task completion, and habit building. Be encouraging and practical. Keep responses concise and actionable."},
-                {"role": "user", "content": message}
-            ],
-            max_tokens=150
-        )
-
-        ai_response = response.choices[0].message.content.strip()
+        message = str(request_payload(request).get('message', '')).strip()
+    except (ValueError, AttributeError):
+        return json_error('Invalid JSON', status.HTTP_400_BAD_REQUEST)
+    if not message:
+        return json_error('No message provided', status.HTTP_400_BAD_REQUEST)
 
-        return Response({'response': ai_response})
+    messages, conversation, key = await coach_context(user, message, coach.TEXT_SYSTEM_PROMPT)
+    if wants_stream(request):
+        # X-Accel-Buffering keeps nginx from holding the events back until the reply is done
+        return StreamingHttpResponse(stream_chat_events(user, message, messages, conversation, key), content_type='text/event-stream',
+                                     headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
+    try:
+        ai_response = await coach.reply(messages, key)
+        await remember(conversation, message, ai_response)
+        return JsonResponse({'response': ai_response})
+    except llm.LLMUnavailable:
+        return JsonResponse({'response': llm.fallback_message(), 'fallback': True})
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        return json_error(str(e), status.HTTP_500_INTERNAL_SERVER_ERROR)
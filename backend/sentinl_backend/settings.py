@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware', 
     'django.middleware.common.CommonMiddleware',
     "django.middleware.security.SecurityMiddleware",
@@ -76,6 +77,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "sentinl_backend.wsgi.application"
+ASGI_APPLICATION = "sentinl_backend.asgi.application"  # serves the async coach views without blocking a worker
 
 
 # Database
@@ -85,6 +87,8 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # File-backed test database so tests can exercise concurrent requests on separate connections
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
@@ -132,7 +136,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'core.authentication.CachedTokenAuthentication',
     ],
 }
 
@@ -141,3 +145,85 @@ from dotenv import load_dotenv
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')  # None uses the public API
+
+# AI coach, see core.coach
+COACH_MODEL = 'gpt-3.5-turbo'
+COACH_TRANSCRIPTION_MODEL = 'whisper-1'
+COACH_MAX_TOKENS = 150
+COACH_CACHE_SIZE = 1000  # replies kept per process, least recently used evicted first
+COACH_CACHE_TTL = 3600
+COACH_CACHE_KEY_FUNCTION = 'core.coachcache.normalized_key'  # or core.coachcache.token_set_key
+COACH_PROMPT_TOKEN_BUDGET = 1000  # estimated prompt tokens per request, see core.memory
+COACH_MEMORY_TURNS = 8  # recent messages kept verbatim; older ones are folded into the summary
+COACH_SUMMARY_TOKENS = 200
+
+# Shared model client, see core.llm
+LLM_TIMEOUT = 30
+LLM_CONNECT_TIMEOUT = 5
+LLM_MAX_RETRIES = 1
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '16'))  # in-flight upstream calls per process
+LLM_QUEUE_TIMEOUT = 2  # seconds to wait for a bulkhead slot before falling back
+LLM_BREAKER_THRESHOLD = 5  # consecutive upstream failures that open the circuit
+LLM_BREAKER_COOLDOWN = 30
+
+# Expo push delivery
+EXPO_PUSH_URL = os.getenv('EXPO_PUSH_URL', 'https://exp.host/--/api/v2/push/send')
+PUSH_BATCH_SIZE = 100
+PUSH_CONCURRENCY = int(os.getenv('PUSH_CONCURRENCY', '4'))
+PUSH_TIMEOUT = 10
+PUSH_WORKER_BATCH_SIZE = 500
+PUSH_MAX_ATTEMPTS = 6
+PUSH_RETRY_BASE_SECONDS = 30
+PUSH_RETRY_MAX_SECONDS = 3600
+
+# Bulk task import
+TASK_IMPORT_MAX_ROWS = 10000
+
+# Delta sync
+SYNC_TOKEN_OVERLAP_SECONDS = 5
+
+# Per-profile read cache, see core.readcache. Point CACHES at Redis/Memcached when running
+# more than one process so every worker shares entries and counters.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'sentinl'),
+    }
+}
+READ_CACHE_ALIAS = 'default'
+READ_CACHE_TIMEOUT = 300
+
+# Token authentication cache, see core.authentication
+AUTH_TOKEN_CACHE_ALIAS = 'default'
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_LOCAL_TTL = 30
+AUTH_TOKEN_CACHE_TTL = 300
+
+# Request metrics, see core.metrics. Server-Timing exposes SQL timings to the client, so
+# only enable it where that is acceptable.
+METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', '') == '1'
+
+# Logging, see core.logconfig. JSON lines on stderr written by a background thread; DEBUG
+# records from chatty loggers are sampled before they are queued.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sample': {
+            '()': 'core.logconfig.SamplingFilter',
+            'rates': {'core.views': 0.01, 'core.achievements': 0.1},
+        },
+    },
+    'handlers': {
+        'queue': {
+            'class': 'core.logconfig.QueueingHandler',
+            'filters': ['sample'],
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': 'WARNING'},
+    'loggers': {
+        'core': {'level': LOG_LEVEL},
+    },
+}
@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.urls import path, include
+from core.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('core.urls')), # This links the folders together
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
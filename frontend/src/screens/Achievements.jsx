@@ -10,7 +10,7 @@ import { LinearGradient } from 'expo-linear-gradient'; // Ensure expo-linear-gra
 const { width } = Dimensions.get('window');
 
 const Achievements = ({ navigation }) => {
-  const { data: profile, isLoading } = useGetProfileQuery();
+  const { data: profile, isLoading } = useGetProfileQuery('achievements');
 
   if (isLoading) return (
     <View style={styles.loadingContainer}>
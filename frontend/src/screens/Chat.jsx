@@ -29,7 +29,9 @@ import {
   Flag
 } from 'lucide-react-native';
 import Toast from 'react-native-toast-message';
-import { useVoiceChatMutation, useTextChatMutation } from '../services/authApi';
+import { useSelector } from 'react-redux';
+import { useVoiceChatMutation } from '../services/authApi';
+import { streamTextChat } from '../services/chatStream';
 
 const Chat = ({ navigation }) => {
   const [messages, setMessages] = useState([
@@ -54,7 +56,7 @@ const Chat = ({ navigation }) => {
   const [menuPos, setMenuPos] = useState({ top: 0, left: 0, isUser: false });
 
   const [voiceChat] = useVoiceChatMutation();
-  const [textChat] = useTextChatMutation();
+  const token = useSelector((state) => state.auth.token);
   const scrollViewRef = useRef();
   const pulseAnim = useRef(new Animated.Value(1)).current;
   const bubbleRefs = useRef({});
@@ -160,19 +162,37 @@ const Chat = ({ navigation }) => {
     };
     setMessages(prev => [...prev, userMsg]);
     setIsAIProcessing(true);
+    // The reply bubble appears with the first token and grows as the coach streams
+    const aiId = Date.now() + 1;
+    let started = false;
+    const setAIText = (update) => setMessages(prev => prev.map(m => (m.id === aiId ? { ...m, text: update(m.text) } : m)));
     try {
-      const response = await textChat(text).unwrap();
-      addAIMessage(response.response);
-    } catch (error) { addAIMessage("Connection error."); }
+      const reply = await streamTextChat({
+        token,
+        message: text,
+        onDelta: (delta) => {
+          if (!started) {
+            started = true;
+            addAIMessage('', aiId);
+          }
+          setAIText(current => current + delta);
+        },
+      });
+      if (started) setAIText(() => reply);
+      else addAIMessage(reply, aiId);
+    } catch (error) {
+      if (started) setAIText(current => `${current}\n\nConnection error.`);
+      else addAIMessage("Connection error.");
+    }
     finally { 
       setIsAIProcessing(false);
       setTimeout(() => scrollViewRef.current?.scrollToEnd({ animated: true }), 100);
     }
   };
 
-  const addAIMessage = (text) => {
+  const addAIMessage = (text, id = Date.now() + 1) => {
     const aiMsg = {
-      id: Date.now() + 1,
+      id,
       type: 'text',
       text: text,
       sender: 'ai',
@@ -1,4 +1,4 @@
-import React from 'react';
+import React, { useState } from 'react';
 import { View, Text, StyleSheet, ScrollView, Platform, SafeAreaView, TouchableOpacity } from 'react-native';
 import { Card } from '../components/ui/Card';
 import { theme } from '../lib/theme';
@@ -7,7 +7,15 @@ import { History as HistoryIcon, CheckCircle2, Zap, Database, Clock, ArrowUpRigh
 import { LinearGradient } from 'expo-linear-gradient';
 
 const History = ({ navigation }) => {
-  const { data: tasks = [], isLoading } = useGetHistoryQuery();
+  const [cursor, setCursor] = useState(null);
+  const { data, isLoading, isFetching } = useGetHistoryQuery(cursor);
+  const tasks = data?.results ?? [];
+
+  const loadMoreOnScroll = ({ nativeEvent }) => {
+    const { layoutMeasurement, contentOffset, contentSize } = nativeEvent;
+    const nearBottom = layoutMeasurement.height + contentOffset.y >= contentSize.height - 200;
+    if (nearBottom && data?.next && !isFetching) setCursor(data.next);
+  };
 
   if (isLoading) return (
     <View style={styles.centerContainer}>
@@ -33,6 +41,8 @@ const History = ({ navigation }) => {
         style={styles.container} 
         contentContainerStyle={styles.scrollPadding} 
         showsVerticalScrollIndicator={false}
+        onScroll={loadMoreOnScroll}
+        scrollEventThrottle={200}
       >
         {tasks.length === 0 ? (
           <View style={styles.emptyState}>
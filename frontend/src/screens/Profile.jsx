@@ -21,7 +21,7 @@ const { width } = Dimensions.get('window');
 const Profile = ({ navigation }) => {
   const user = useSelector((state) => state.auth.user);
   const dispatch = useDispatch();
-  const { data: profile, isLoading, error } = useGetProfileQuery();
+  const { data: profile, isLoading, error } = useGetProfileQuery('achievements');
 
   useEffect(() => {
     if (error && error.status === 403) handleLogout();
@@ -114,7 +114,7 @@ const Profile = ({ navigation }) => {
             <View style={styles.statBox}>
               <Award size={18} color="#94a3b8" />
               <Text style={styles.statVal}>
-                {profile.tasks?.filter(t => t.is_completed).length || 0}
+                {profile.completed_tasks_count || 0}
               </Text>
               <Text style={styles.statSub}>OBJECTIVES SECURED</Text>
             </View>
@@ -1,8 +1,10 @@
 import { createApi, fetchBaseQuery } from '@reduxjs/toolkit/query/react';
 import { setCredentials } from '../store/authSlice';
 
+export const API_BASE_URL = 'http://10.99.140.107:8000/api/';
+
 const baseQuery = fetchBaseQuery({
-  baseUrl: 'http://10.99.140.107:8000/api/',
+  baseUrl: API_BASE_URL,
   prepareHeaders: (headers, { getState }) => {
     const token = getState().auth.token;
     console.log('Auth API Token:', token);
@@ -50,9 +52,10 @@ export const authApi = createApi({
       },
     }),
     getProfile: builder.query({
-      query: () => {
+      // Nested collections are opt-in, e.g. useGetProfileQuery('achievements')
+      query: (include) => {
         console.log('Retrieving profile data');
-        return 'profile/';
+        return include ? `profile/?include=${include}` : 'profile/';
       },
       keepUnusedDataFor: 300, // Cache for 5 minutes
     }),
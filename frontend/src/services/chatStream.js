@@ -0,0 +1,46 @@
+import { API_BASE_URL } from './authApi';
+
+// React Native's fetch cannot read a response body incrementally, but XMLHttpRequest
+// exposes the partial responseText on every progress event.
+export const streamTextChat = ({ token, message, onDelta }) =>
+  new Promise((resolve, reject) => {
+    const xhr = new XMLHttpRequest();
+    let seen = 0;
+    let buffer = '';
+    let reply = null;
+    let failed = null;
+
+    const consume = () => {
+      buffer += xhr.responseText.slice(seen);
+      seen = xhr.responseText.length;
+      const events = buffer.split('\n\n');
+      buffer = events.pop();
+      events.forEach((raw) => {
+        let event = 'message';
+        let data = '';
+        raw.split('\n').forEach((line) => {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        });
+        if (!data) return;
+        const payload = JSON.parse(data);
+        if (event === 'done') reply = payload.response;
+        else if (event === 'error') failed = new Error(payload.error);
+        else onDelta(payload.delta);
+      });
+    };
+
+    xhr.open('POST', `${API_BASE_URL}text-chat/?stream=1`);
+    xhr.setRequestHeader('Content-Type', 'application/json');
+    xhr.setRequestHeader('Accept', 'text/event-stream');
+    if (token) xhr.setRequestHeader('Authorization', `Token ${token}`);
+    xhr.onprogress = consume;
+    xhr.onload = () => {
+      consume();
+      if (xhr.status !== 200) reject(new Error(`HTTP ${xhr.status}`));
+      else if (failed || reply === null) reject(failed || new Error('Stream ended early'));
+      else resolve(reply);
+    };
+    xhr.onerror = () => reject(new Error('Network error'));
+    xhr.send(JSON.stringify({ message }));
+  });
@@ -22,8 +22,21 @@ export const tasksApi = createApi({
       providesTags: ['Task'], // This allows "Auto-refreshing" when data changes
       keepUnusedDataFor: 300, // Cache for 5 minutes
     }),
+    syncChanges: builder.query({
+      // Returns rows changed since `since` plus tombstones and the token for the next call
+      query: (since) => (since ? `sync/?since=${since}` : 'sync/'),
+    }),
     getHistory: builder.query({
-      query: () => 'history/',
+      query: (cursor) => (cursor ? `history/?cursor=${encodeURIComponent(cursor)}` : 'history/'),
+      // Pages share one cache entry; later pages are appended as the user scrolls
+      serializeQueryArgs: ({ endpointName }) => endpointName,
+      merge: (current, incoming, { arg }) => {
+        if (!arg) return incoming;
+        const seen = new Set(current.results.map((task) => task.id));
+        current.results.push(...incoming.results.filter((task) => !seen.has(task.id)));
+        current.next = incoming.next;
+      },
+      forceRefetch: ({ currentArg, previousArg }) => currentArg !== previousArg,
       providesTags: ['Task'],
     }),
     updateTask: builder.mutation({
@@ -34,6 +47,15 @@ export const tasksApi = createApi({
       }),
       invalidatesTags: ['Task'], // Automatically refetches the list after an update
     }),
+    completeTasks: builder.mutation({
+      // completions: [{ id, is_completed }] or [{ id, is_micro_completed }]
+      query: (completions) => ({
+        url: 'tasks/complete/',
+        method: 'POST',
+        body: { tasks: completions },
+      }),
+      invalidatesTags: ['Task'],
+    }),
     createTask: builder.mutation({
       query: (task) => ({
         url: 'tasks/',
@@ -45,4 +67,4 @@ export const tasksApi = createApi({
   }),
 });
 
-export const { useGetTasksQuery, useUpdateTaskMutation, useGetHistoryQuery, useCreateTaskMutation } = tasksApi;
\ No newline at end of file
+export const { useGetTasksQuery, useUpdateTaskMutation, useCompleteTasksMutation, useGetHistoryQuery, useLazySyncChangesQuery, useCreateTaskMutation } = tasksApi;
\ No newline at end of file